@@ -2,7 +2,21 @@
 
 import numpy as np
 import pandas as pd
+from scipy.spatial.distance import cdist, squareform
 from sklearn.metrics.pairwise import euclidean_distances # Not directly used in this version, but good for context
+# Numba is optional: it only provides the JIT-compiled backend for the genetic distance fill
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+# joblib (installed with scikit-learn) is only needed when GENETIC_DIST_N_JOBS != 1
+try:
+    from joblib import Parallel, delayed
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
 
 # --- Simulation Parameters ---
 N_INDIVIDUALS = 120
@@ -26,11 +40,16 @@ GENETIC_DIST_BASE = 0.8
 GENETIC_DIST_SAME_GROUP_EFFECT = -0.3
 GENETIC_DIST_SAME_FAMILY_EFFECT = -0.4
 GENETIC_DIST_HYBRID_FACTOR = 0.5
+GENETIC_DIST_SEED = 'uniform' # 'uniform' (independent random draws) or 'traits' (rescaled trait distances via cdist)
+GENETIC_DIST_BACKEND = 'numpy' # 'numpy' (vectorized masks) or 'numba' (JIT-compiled pair loop, requires numba)
+GENETIC_DIST_N_JOBS = 1 # numpy backend only: >1 (or -1 for all cores) computes row blocks in parallel with joblib
+GENETIC_DIST_ROW_BLOCK = 256 # Rows of the upper triangle handled per block
 
 # --- Output Filenames ---
 INDIVIDUALS_FILE = 'simulated_individuals.csv'
 TRAITS_FILE = 'simulated_traits.csv'
 GENETIC_DIST_FILE = 'simulated_genetic_distances.csv'
+GENETIC_DIST_NPY_FILE = 'simulated_genetic_distances.npy' # Binary copy; rows/columns follow individual_id order
 
 # --- Helper Functions ---
 def assign_groups_and_hybrids(n_individuals, group_proportions, n_hybrids, n_true_groups):
@@ -54,105 +73,160 @@ def assign_groups_and_hybrids(n_individuals, group_proportions, n_hybrids, n_tru
     np.random.shuffle(assignments)
     return assignments[:n_individuals]
 
+def fill_genetic_distances(dist, jitter, group_codes, family_ids, is_hybrid, is_parent,
+                           same_group_effect, same_family_effect, hybrid_to_parent_dist, hybrid_to_hybrid_dist):
+    # Scalar pair loop over pre-extracted arrays; compiled with numba when GENETIC_DIST_BACKEND == 'numba'.
+    # Row i only writes dist[i, j] and dist[j, i] for j > i, so parallel rows never touch the same cell.
+    n = dist.shape[0]
+    for i in prange(n):
+        dist[i, i] = 0.0
+        for j in range(i + 1, n):
+            d = dist[i, j]
+            if group_codes[i] == group_codes[j] and not is_hybrid[i]: d += same_group_effect
+            if family_ids[i] != -1 and family_ids[i] == family_ids[j]: d += same_family_effect
+            if (is_hybrid[i] and is_parent[j]) or (is_hybrid[j] and is_parent[i]): # Hybrid to G1 or G2
+                d = hybrid_to_parent_dist + jitter[i, j]
+            elif is_hybrid[i] and is_hybrid[j]: # Hybrid to Hybrid
+                d = hybrid_to_hybrid_dist + jitter[i, j]
+            d = max(0.01, d)
+            dist[i, j] = d
+            dist[j, i] = d
+    return dist
+
+if NUMBA_AVAILABLE:
+    fill_genetic_distances = njit(parallel=True)(fill_genetic_distances)
+
+def compute_upper_distance_block(base, jitter, iu, ju, group_codes, family_ids, is_hybrid, is_parent,
+                                 same_group_effect, same_family_effect, hybrid_to_parent_dist, hybrid_to_hybrid_dist):
+    # Vectorized rules for one contiguous stripe of condensed (pdist-order) upper-triangle pairs (iu < ju)
+    same_group = (group_codes[iu] == group_codes[ju]) & ~is_hybrid[iu]
+    same_family = (family_ids[iu] == family_ids[ju]) & (family_ids[iu] != -1)
+    hybrid_to_parent = (is_hybrid[iu] & is_parent[ju]) | (is_parent[iu] & is_hybrid[ju]) # Hybrid to G1 or G2
+    hybrid_to_hybrid = is_hybrid[iu] & is_hybrid[ju]
+
+    dist = base + same_group_effect * same_group + same_family_effect * same_family
+    dist = np.where(hybrid_to_parent, hybrid_to_parent_dist + jitter, dist)
+    dist = np.where(hybrid_to_hybrid, hybrid_to_hybrid_dist + jitter, dist)
+    np.maximum(dist, 0.01, out=dist)
+    return dist
+
 # --- Main Simulation ---
 print("SCRIPT 1: Simulating data...")
 np.random.seed(42) # For reproducibility
 
+# Draw every fixed-size random array once, up front; the steps below consume them in vectorized assignments
+family_pool_draw = np.random.permutation(N_INDIVIDUALS)
+family_size_draw = np.random.randint(FAMILY_SIZE_MIN, FAMILY_SIZE_MAX + 1, N_FAMILIES)
+hybrid_prob_e1_draw = np.random.choice([0.8, 0.2, 0.5], p=[0.4, 0.4, 0.2], size=N_INDIVIDUALS)
+env_uniform_draw = np.random.rand(N_INDIVIDUALS)
+trait_means_draw = np.random.uniform(-TRAIT_GROUP_EFFECT_SCALE, TRAIT_GROUP_EFFECT_SCALE, (N_TRUE_GROUPS, N_TRAITS))
+env_effect_draw = np.random.uniform(-TRAIT_ENV_EFFECT_SCALE, TRAIT_ENV_EFFECT_SCALE, (N_INDIVIDUALS, N_TRAITS)) / 2
+noise_draw = np.random.normal(0, TRAIT_NOISE_STD, (N_INDIVIDUALS, N_TRAITS))
+base_dist_draw = np.random.uniform(GENETIC_DIST_BASE - 0.1, GENETIC_DIST_BASE + 0.1, (N_INDIVIDUALS, N_INDIVIDUALS))
+hybrid_jitter = np.random.uniform(-0.05, 0.05, (N_INDIVIDUALS, N_INDIVIDUALS))
+
 # 1. Individual IDs and True Group Assignments
 individual_ids = np.arange(N_INDIVIDUALS)
 true_group_assignments = assign_groups_and_hybrids(N_INDIVIDUALS, GROUP_PROPORTIONS, N_HYBRIDS, N_TRUE_GROUPS)
 
 individuals_df = pd.DataFrame({
     'individual_id': individual_ids,
-    'true_group': true_group_assignments
+    'true_group': pd.Categorical(true_group_assignments) # Low-cardinality labels: stored as integer codes
 })
 
+# Per-individual group masks, computed once and reused by every step below instead of string tests per pair
+groups = np.asarray(true_group_assignments)
+is_g1, is_g2, is_g3 = groups == "G1", groups == "G2", groups == "G3"
+is_hybrid = np.array(["Hybrid" in g for g in groups], dtype=bool)
+
 # 2. Assign Families (Kin Groups)
+# Split the shuffled index pool into consecutive blocks of the drawn family sizes, keeping only families that fit
+family_sizes = family_size_draw[np.cumsum(family_size_draw) <= N_INDIVIDUALS]
+family_members = family_pool_draw[:family_sizes.sum()]
 family_ids = np.full(N_INDIVIDUALS, -1, dtype=int)
-current_family_id = 0
-individual_indices_pool = list(range(N_INDIVIDUALS))
-np.random.shuffle(individual_indices_pool)
-
-for _ in range(N_FAMILIES):
-    if len(individual_indices_pool) < FAMILY_SIZE_MIN:
-        break
-    family_size = np.random.randint(FAMILY_SIZE_MIN, FAMILY_SIZE_MAX + 1)
-    if len(individual_indices_pool) < family_size:
-        continue
-
-    current_family_members_indices = [individual_indices_pool.pop() for _ in range(family_size)]
-    for member_idx in current_family_members_indices:
-        family_ids[member_idx] = current_family_id
-    current_family_id += 1
+family_ids[family_members] = np.repeat(np.arange(len(family_sizes)), family_sizes)
 individuals_df['family_id'] = family_ids
 
 # 3. Assign Environments
-env_assignments = np.empty(N_INDIVIDUALS, dtype=object)
-for i, row in individuals_df.iterrows():
-    group = row['true_group']
-    prob_e1 = 0.5
-    if group == "G1": prob_e1 = 0.8
-    elif group == "G2": prob_e1 = 0.2
-    elif group == "G3": prob_e1 = 0.6
-    elif group == "Hybrid_G1G2": prob_e1 = np.random.choice([0.8,0.2,0.5], p=[0.4,0.4,0.2])
-    env_assignments[i] = "E1" if np.random.rand() < prob_e1 else "E2"
-individuals_df['environment'] = env_assignments
+prob_e1 = np.select([is_g1, is_g2, is_g3, groups == "Hybrid_G1G2"],
+                    [0.8, 0.2, 0.6, hybrid_prob_e1_draw], default=0.5)
+individuals_df['environment'] = pd.Categorical(np.where(env_uniform_draw < prob_e1, "E1", "E2"))
 
 # 4. Simulate Traits
-traits_data = np.zeros((N_INDIVIDUALS, N_TRAITS))
-trait_means_by_group = { f"G{i+1}": np.random.uniform(-TRAIT_GROUP_EFFECT_SCALE, TRAIT_GROUP_EFFECT_SCALE, N_TRAITS) for i in range(N_TRUE_GROUPS)}
+trait_means_by_group = { f"G{i+1}": trait_means_draw[i] for i in range(N_TRUE_GROUPS)}
 trait_means_by_group["Hybrid_G1G2"] = (trait_means_by_group.get("G1", np.zeros(N_TRAITS)) + trait_means_by_group.get("G2", np.zeros(N_TRAITS))) / 2.0
 
-for i in range(N_INDIVIDUALS):
-    group = individuals_df.loc[i, 'true_group']
-    env = individuals_df.loc[i, 'environment']
-    base_traits = trait_means_by_group.get(group, np.zeros(N_TRAITS)).copy()
-    if env == "E1": base_traits += np.random.uniform(-TRAIT_ENV_EFFECT_SCALE, TRAIT_ENV_EFFECT_SCALE, N_TRAITS) / 2
-    else: base_traits -= np.random.uniform(-TRAIT_ENV_EFFECT_SCALE, TRAIT_ENV_EFFECT_SCALE, N_TRAITS) / 2
-    traits_data[i, :] = base_traits + np.random.normal(0, TRAIT_NOISE_STD, N_TRAITS)
+# Gather each individual's group mean in one indexed lookup, then add environment and noise draws for all individuals at once
+trait_group_labels = sorted(trait_means_by_group)
+group_mean_table = np.stack([trait_means_by_group[g] for g in trait_group_labels] + [np.zeros(N_TRAITS)]) # Last row: unknown group
+label_to_idx = {g: idx for idx, g in enumerate(trait_group_labels)}
+trait_group_codes = np.array([label_to_idx.get(g, len(trait_group_labels)) for g in individuals_df['true_group']])
+
+environments = np.asarray(individuals_df['environment'])
+in_e1 = environments == "E1"
+traits_data = group_mean_table[trait_group_codes] + np.where(in_e1[:, None], env_effect_draw, -env_effect_draw) + noise_draw
 
 plasticity_trait_idx, plasticity_group = 0, "G1"
-for i in individuals_df[individuals_df['true_group'] == plasticity_group].index:
-    traits_data[i, plasticity_trait_idx] += TRAIT_PLASTICITY_EFFECT if individuals_df.loc[i, 'environment'] == "E1" else -TRAIT_PLASTICITY_EFFECT
+plasticity_mask = groups == plasticity_group
+traits_data[plasticity_mask & in_e1, plasticity_trait_idx] += TRAIT_PLASTICITY_EFFECT
+traits_data[plasticity_mask & ~in_e1, plasticity_trait_idx] -= TRAIT_PLASTICITY_EFFECT
 print(f"Introduced plasticity for {plasticity_group} on Trait {plasticity_trait_idx}.")
 
 convergence_trait_idx, convergence_groups, convergence_env = 1, ["G1", "G3"], "E2"
-for i in individuals_df[individuals_df['true_group'].isin(convergence_groups) & (individuals_df['environment'] == convergence_env)].index:
-    traits_data[i, convergence_trait_idx] += TRAIT_CONVERGENCE_EFFECT
+convergence_mask = np.isin(groups, convergence_groups) & (environments == convergence_env)
+traits_data[convergence_mask, convergence_trait_idx] += TRAIT_CONVERGENCE_EFFECT
 print(f"Introduced convergent evolution for {convergence_groups} on Trait {convergence_trait_idx} in {convergence_env}.")
 
 traits_df = pd.DataFrame(traits_data, columns=[f'trait_{j}' for j in range(N_TRAITS)])
 traits_df['individual_id'] = individual_ids
 traits_df = traits_df[['individual_id'] + [f'trait_{j}' for j in range(N_TRAITS)]]
 
-# 5. Simulate Genetic Distance Matrix
-genetic_distance_matrix = np.random.uniform(GENETIC_DIST_BASE - 0.1, GENETIC_DIST_BASE + 0.1, (N_INDIVIDUALS, N_INDIVIDUALS))
-np.fill_diagonal(genetic_distance_matrix, 0)
-
-for i in range(N_INDIVIDUALS):
-    for j in range(i + 1, N_INDIVIDUALS):
-        dist = genetic_distance_matrix[i, j]
-        group_i, group_j = individuals_df.loc[i, 'true_group'], individuals_df.loc[j, 'true_group']
-        family_i, family_j = individuals_df.loc[i, 'family_id'], individuals_df.loc[j, 'family_id']
-
-        if group_i == group_j and "Hybrid" not in group_i : dist += GENETIC_DIST_SAME_GROUP_EFFECT
-        if family_i != -1 and family_i == family_j: dist += GENETIC_DIST_SAME_FAMILY_EFFECT
-        
-        is_hybrid_i, is_hybrid_j = "Hybrid" in group_i, "Hybrid" in group_j
-        g1_i, g1_j = group_i == "G1", group_j == "G1"
-        g2_i, g2_j = group_i == "G2", group_j == "G2"
-
-        if (is_hybrid_i and (g1_j or g2_j)) or (is_hybrid_j and (g1_i or g2_i)): # Hybrid to G1 or G2
-            dist = (GENETIC_DIST_BASE + GENETIC_DIST_SAME_GROUP_EFFECT/2) * GENETIC_DIST_HYBRID_FACTOR + np.random.uniform(-0.05, 0.05)
-        elif is_hybrid_i and is_hybrid_j: # Hybrid to Hybrid
-            dist = (GENETIC_DIST_BASE + GENETIC_DIST_SAME_GROUP_EFFECT/2) * (GENETIC_DIST_HYBRID_FACTOR + 0.1) + np.random.uniform(-0.05, 0.05)
-
-        dist = max(0.01, dist)
-        genetic_distance_matrix[i, j] = genetic_distance_matrix[j, i] = dist
-
-genetic_dist_df = pd.DataFrame(genetic_distance_matrix, index=individual_ids, columns=individual_ids)
-genetic_dist_df.index.name = 'individual_id_row' # Clarify index name for CSV
-genetic_dist_df.columns.name = 'individual_id_col' # Clarify column name for CSV
+# 5. Simulate Genetic Distance Matrix (vectorized masks, or a JIT-compiled pair loop with the numba backend)
+group_codes = pd.factorize(groups)[0]
+is_parent = is_g1 | is_g2
+
+if GENETIC_DIST_SEED == 'traits':
+    # Tie the baseline to phenotype: Euclidean trait distances rescaled into the same range as the uniform draw
+    trait_distances = cdist(traits_data, traits_data, metric='euclidean')
+    trait_distances /= trait_distances.max() or 1.0
+    genetic_distance_matrix = (GENETIC_DIST_BASE - 0.1) + 0.2 * trait_distances
+else:
+    genetic_distance_matrix = base_dist_draw.copy() # The numba backend fills this in place
+
+hybrid_dist_base = GENETIC_DIST_BASE + GENETIC_DIST_SAME_GROUP_EFFECT / 2
+hybrid_to_parent_dist = hybrid_dist_base * GENETIC_DIST_HYBRID_FACTOR
+hybrid_to_hybrid_dist = hybrid_dist_base * (GENETIC_DIST_HYBRID_FACTOR + 0.1)
+
+if GENETIC_DIST_BACKEND == 'numba' and NUMBA_AVAILABLE:
+    genetic_distance_matrix = fill_genetic_distances(genetic_distance_matrix, hybrid_jitter,
+                                                     group_codes.astype(np.int32), family_ids.astype(np.int32), is_hybrid, is_parent,
+                                                     GENETIC_DIST_SAME_GROUP_EFFECT, GENETIC_DIST_SAME_FAMILY_EFFECT,
+                                                     hybrid_to_parent_dist, hybrid_to_hybrid_dist)
+else:
+    if GENETIC_DIST_BACKEND == 'numba':
+        print("Warning: numba is not installed. Falling back to the vectorized NumPy backend for genetic distances.")
+    # Work on the condensed upper triangle only (pdist order): each pair is computed and stored once
+    iu, ju = np.triu_indices(N_INDIVIDUALS, 1)
+    base_upper, jitter_upper = genetic_distance_matrix[iu, ju], hybrid_jitter[iu, ju]
+
+    # Split into stripes of whole rows; row r starts at row_offsets[r] in the condensed buffer
+    row_offsets = np.concatenate(([0], np.cumsum(np.arange(N_INDIVIDUALS - 1, 0, -1))))
+    block_bounds = [(row_offsets[r], row_offsets[min(r + GENETIC_DIST_ROW_BLOCK, N_INDIVIDUALS - 1)])
+                    for r in range(0, N_INDIVIDUALS - 1, GENETIC_DIST_ROW_BLOCK)]
+    block_tasks = [(base_upper[a:b], jitter_upper[a:b], iu[a:b], ju[a:b], group_codes, family_ids, is_hybrid, is_parent,
+                    GENETIC_DIST_SAME_GROUP_EFFECT, GENETIC_DIST_SAME_FAMILY_EFFECT, hybrid_to_parent_dist, hybrid_to_hybrid_dist)
+                   for a, b in block_bounds]
+
+    if GENETIC_DIST_N_JOBS != 1 and JOBLIB_AVAILABLE:
+        upper_blocks = Parallel(n_jobs=GENETIC_DIST_N_JOBS)(delayed(compute_upper_distance_block)(*task) for task in block_tasks)
+    else:
+        if GENETIC_DIST_N_JOBS != 1:
+            print("Warning: joblib is not installed. Computing genetic distance blocks serially.")
+        upper_blocks = [compute_upper_distance_block(*task) for task in block_tasks]
+    upper_distances = np.concatenate(upper_blocks) if upper_blocks else np.empty(0)
+
+    # Expand to the full symmetric matrix with a zero diagonal
+    genetic_distance_matrix = squareform(upper_distances)
 
 
 # --- Save DataFrames to CSV ---
@@ -160,7 +234,14 @@ individuals_df.to_csv(INDIVIDUALS_FILE, index=False)
 print(f"\nSaved individuals data to {INDIVIDUALS_FILE}")
 traits_df.to_csv(TRAITS_FILE, index=False)
 print(f"Saved traits data to {TRAITS_FILE}")
-genetic_dist_df.to_csv(GENETIC_DIST_FILE, index=True) # Save index for genetic distance matrix
+# Same layout as DataFrame.to_csv (header 'individual_id_row,<ids>', then one ID-prefixed row per individual),
+# but formatted by np.savetxt in one pass; %.17g keeps every float64 exactly
+with open(GENETIC_DIST_FILE, 'w') as f_csv:
+    f_csv.write('individual_id_row,' + ','.join(map(str, individual_ids)) + '\n')
+    np.savetxt(f_csv, np.column_stack((individual_ids, genetic_distance_matrix)), delimiter=',',
+               fmt=['%d'] + ['%.17g'] * N_INDIVIDUALS)
 print(f"Saved genetic distance matrix to {GENETIC_DIST_FILE}")
+np.save(GENETIC_DIST_NPY_FILE, genetic_distance_matrix) # Fast, lossless binary copy read by Script 2
+print(f"Saved genetic distance matrix (binary) to {GENETIC_DIST_NPY_FILE}")
 
 print("\nSCRIPT 1: Data simulation and saving complete.")
\ No newline at end of file
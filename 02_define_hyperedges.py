@@ -1,15 +1,44 @@
 # SCRIPT 2: Loading Data, Defining Hyperedges, and SAVING Hyperedges
 
+import os
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import StandardScaler
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
 import json # Import json for saving the hyperedge list
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_utils import load_table, zscore_columns # Helpers shared with Scripts 6 and 7
+# Numba is optional: it only provides the JIT-compiled backend for the genetic k-NN selection
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+# orjson is optional: it serializes the hyperedge list in C; the stdlib json module is used otherwise
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # --- Input Filenames (must match output from Script 1) ---
 INDIVIDUALS_FILE = 'simulated_individuals.csv'
 TRAITS_FILE = 'simulated_traits.csv'
 GENETIC_DIST_FILE = 'simulated_genetic_distances.csv'
+GENETIC_DIST_NPY_FILE = 'simulated_genetic_distances.npy' # Preferred over the CSV when present
+
+# --- Parallel hyperedge generation ---
+HYPEREDGE_N_WORKERS = None # Threads for the per-category generators (None = executor default, 1 = run one at a time)
+
+# --- Sparse genetic neighbourhoods ---
+GENETIC_DIST_THRESH_ENABLED = False # Generate distance-threshold hyperedges; the sparse matrix below is only built when True
+GENETIC_DIST_CAP = 0.5 # Only pairs closer than this are kept in the sparse matrix used by distance-threshold hyperedges
+GENETIC_DIST_SPARSE_FILE = f'simulated_genetic_distances_lt{GENETIC_DIST_CAP}.npz' # Cached CSR, rebuilt when older than its source
+
+# --- Genetic k-NN backend ---
+GENETIC_KNN_BACKEND = 'numpy' # 'numpy' (np.argpartition) or 'numba' (JIT-compiled per-row top-k, requires numba)
 
 # --- Output Filename for Hyperedges ---
 HYPEREDGES_FILE = 'simulated_hyperedges.json'
@@ -17,11 +46,32 @@ HYPEREDGES_FILE = 'simulated_hyperedges.json'
 # --- Load DataFrames ---
 print("SCRIPT 2: Loading simulated data...")
 try:
-    individuals_df = pd.read_csv(INDIVIDUALS_FILE)
-    traits_df = pd.read_csv(TRAITS_FILE)
-    genetic_dist_df = pd.read_csv(GENETIC_DIST_FILE, index_col=0)
-    genetic_dist_df.columns = genetic_dist_df.columns.astype(int)
-    genetic_dist_df.index = genetic_dist_df.index.astype(int)
+    individuals_df = load_table(INDIVIDUALS_FILE)
+    traits_df = load_table(TRAITS_FILE)
+    # The .npy copy is only used while it is at least as new as the CSV, so a regenerated or replaced CSV is not ignored
+    use_genetic_dist_npy = os.path.exists(GENETIC_DIST_NPY_FILE) and (
+        not os.path.exists(GENETIC_DIST_FILE) or os.path.getmtime(GENETIC_DIST_NPY_FILE) >= os.path.getmtime(GENETIC_DIST_FILE))
+    if use_genetic_dist_npy:
+        # Binary fast path: rows/columns are in the same individual_id order as INDIVIDUALS_FILE
+        genetic_distance_matrix = np.load(GENETIC_DIST_NPY_FILE)
+        matrix_ids = individuals_df['individual_id'].values
+        genetic_dist_df = pd.DataFrame(genetic_distance_matrix, index=matrix_ids, columns=matrix_ids)
+    else:
+        genetic_dist_df = pd.read_csv(GENETIC_DIST_FILE, index_col=0)
+        genetic_dist_df.columns = genetic_dist_df.columns.astype(int)
+        genetic_dist_df.index = genetic_dist_df.index.astype(int)
+    genetic_dist_source = GENETIC_DIST_NPY_FILE if use_genetic_dist_npy else GENETIC_DIST_FILE
+    genetic_dist_csr = None # Only the distance-threshold hyperedges read it
+    if GENETIC_DIST_THRESH_ENABLED:
+        if os.path.exists(GENETIC_DIST_SPARSE_FILE) and os.path.getmtime(GENETIC_DIST_SPARSE_FILE) >= os.path.getmtime(genetic_dist_source):
+            genetic_dist_csr = sp.load_npz(GENETIC_DIST_SPARSE_FILE).tocsr()
+        else:
+            # Explicit entries for every pair below the cap, zero self-distances included
+            close_rows, close_cols = np.nonzero(genetic_dist_df.values < GENETIC_DIST_CAP)
+            genetic_dist_csr = sp.csr_matrix((genetic_dist_df.values[close_rows, close_cols], (close_rows, close_cols)),
+                                             shape=genetic_dist_df.shape)
+            sp.save_npz(GENETIC_DIST_SPARSE_FILE, genetic_dist_csr)
+    genetic_dist_ids = genetic_dist_df.columns.values.astype(np.int32) # CSR column -> individual ID, converted once
     print("Data loaded successfully.")
     # (Optional: print df.head() to verify)
 except FileNotFoundError as e:
@@ -31,9 +81,32 @@ except Exception as e:
     print(f"An error occurred while loading data: {e}")
     exit()
 
-# --- Helper Function to remove duplicate hyperedges ---
-def unique_hyperedges(hyperedge_list):
-    return list(set(hyperedge_list))
+def knn_rows(dist, k):
+    # Indices of the k+1 smallest entries of every row, kept by insertion into a fixed-size buffer.
+    # Compiled with numba when GENETIC_KNN_BACKEND == 'numba' (main thread only); each row writes only its own slice of out.
+    n, m = dist.shape
+    out = np.empty((n, k + 1), dtype=np.int32)
+    best = np.empty((n, k + 1), dtype=dist.dtype)
+    for i in prange(n):
+        filled = 0
+        for j in range(m):
+            d = dist[i, j]
+            if filled == k + 1 and d >= best[i, k]:
+                continue
+            pos = filled if filled < k + 1 else k # Slot to fill, or the current worst one to evict
+            while pos > 0 and best[i, pos - 1] > d:
+                if pos < k + 1:
+                    best[i, pos] = best[i, pos - 1]
+                    out[i, pos] = out[i, pos - 1]
+                pos -= 1
+            best[i, pos] = d
+            out[i, pos] = j
+            if filled < k + 1:
+                filled += 1
+    return out
+
+if NUMBA_AVAILABLE:
+    knn_rows = njit(parallel=True, fastmath=True)(knn_rows)
 
 # --- Hyperedge Definition Functions (Identical to previous version) ---
 def get_trait_knn_hyperedges(traits_df, individual_ids_col='individual_id', k=5, scale_traits=True):
@@ -45,16 +118,14 @@ def get_trait_knn_hyperedges(traits_df, individual_ids_col='individual_id', k=5,
         print("No trait feature columns found in traits_df.")
         return []
     trait_values = traits_df[trait_feature_cols].values
-    ids = traits_df[individual_ids_col].values
+    ids = traits_df[individual_ids_col].values.astype(np.int32)
     if scale_traits:
-        scaler = StandardScaler()
-        trait_values = scaler.fit_transform(trait_values)
-    nn = NearestNeighbors(n_neighbors=k + 1, algorithm='auto', metric='euclidean')
-    nn.fit(trait_values)
-    _, indices = nn.kneighbors(trait_values)
-    hyperedges = [frozenset(ids[indices[i]]) for i in range(len(indices))]
+        trait_values = zscore_columns(trait_values)
+    tree = cKDTree(trait_values)
+    _, indices = tree.query(trait_values, k=k + 1, workers=-1) # Euclidean k-NN, queries spread over all cores
+    hyperedges = set(map(tuple, np.sort(ids[indices], axis=1).tolist())) # Duplicates collapse as the set is filled
     # print(f"Generated {len(hyperedges)} trait k-NN hyperedges (k={k}).") # Moved print to example usage
-    return unique_hyperedges(hyperedges)
+    return hyperedges
 
 def get_trait_threshold_hyperedges(traits_df, trait_column, threshold, mode='above', individual_ids_col='individual_id'):
     if traits_df.empty or trait_column not in traits_df.columns or individual_ids_col not in traits_df.columns:
@@ -64,134 +135,145 @@ def get_trait_threshold_hyperedges(traits_df, trait_column, threshold, mode='abo
     elif mode == 'below': selected_individuals = traits_df[traits_df[trait_column] < threshold][individual_ids_col].values
     else: print("Invalid mode for trait threshold. Choose 'above' or 'below'."); return []
     if len(selected_individuals) > 1:
-        hyperedge = frozenset(selected_individuals)
+        hyperedge = tuple(sorted(selected_individuals.tolist()))
         # print(f"Generated 1 trait threshold hyperedge for {trait_column} {mode} {threshold} with {len(hyperedge)} members.")
         return [hyperedge]
     # print(f"No individuals met trait threshold criteria for {trait_column} {mode} {threshold} or only one individual found.")
     return []
 
-def get_genetic_knn_hyperedges(genetic_dist_df, k=5):
+def get_genetic_knn_hyperedges(genetic_dist_df, k=5, backend='numpy'):
     if genetic_dist_df.empty: print("Genetic distance DataFrame is empty."); return []
-    ids = genetic_dist_df.index.values
-    hyperedges = []
-    for i, _ in enumerate(ids): # individual_id is ids[i]
-        distances_to_individual = genetic_dist_df.iloc[i].sort_values()
-        neighbor_ids_series = distances_to_individual.head(k + 1).index
-        hyperedges.append(frozenset(neighbor_ids_series.astype(int)))
+    dist = genetic_dist_df.values
+    ids = genetic_dist_df.index.values.astype(np.int32) # Individual IDs fit in int32; halves the gathered (N, k+1) block
+    k_eff = min(k, len(ids) - 1) # argpartition needs kth < number of columns
+    # k+1 smallest distances per row (the individual itself plus k neighbours)
+    # The parallel kernel may only be started from the main thread; from a worker it hangs the process at exit
+    on_main_thread = threading.current_thread() is threading.main_thread()
+    if backend == 'numba' and NUMBA_AVAILABLE and on_main_thread:
+        neighbor_idx = knn_rows(np.ascontiguousarray(dist), k_eff)
+    else:
+        if backend == 'numba' and not NUMBA_AVAILABLE:
+            print("Warning: numba is not installed. Falling back to np.argpartition for genetic k-NN.")
+        elif backend == 'numba':
+            print("Warning: numba k-NN called off the main thread. Falling back to np.argpartition for genetic k-NN.")
+        neighbor_idx = np.argpartition(dist, k_eff, axis=1)[:, :k_eff + 1] # Selected in one C pass
+    hyperedges = set(map(tuple, np.sort(ids[neighbor_idx], axis=1).tolist()))
     # print(f"Generated {len(hyperedges)} genetic k-NN hyperedges (k={k}).")
-    return unique_hyperedges(hyperedges)
+    return hyperedges
 
 def get_family_hyperedges(individuals_df, family_id_col='family_id', individual_ids_col='individual_id', min_family_size=2):
     if individuals_df.empty or family_id_col not in individuals_df.columns or individual_ids_col not in individuals_df.columns:
         print("Individuals DataFrame error or column missing for family hyperedges."); return []
-    hyperedges = []
-    valid_families = individuals_df[individuals_df[family_id_col] != -1]
-    grouped_by_family = valid_families.groupby(family_id_col)
-    for _, group in grouped_by_family:
-        if len(group) >= min_family_size:
-            hyperedges.append(frozenset(group[individual_ids_col].values))
+    valid_families = individuals_df[individuals_df[family_id_col] != -1].sort_values(individual_ids_col) # Groups keep this order
+    grouped_by_family = valid_families.groupby(family_id_col)[individual_ids_col]
+    family_sizes = grouped_by_family.size()
+    hyperedges = set(grouped_by_family.agg(tuple)[family_sizes >= min_family_size])
     # print(f"Generated {len(hyperedges)} family-based hyperedges (min_family_size={min_family_size}).")
-    return unique_hyperedges(hyperedges)
+    return hyperedges
 
-def get_genetic_distance_threshold_hyperedges(genetic_dist_df, dist_threshold=0.2, min_size=2):
-    if genetic_dist_df.empty: print("Genetic distance DataFrame is empty."); return []
-    ids = genetic_dist_df.index.values
-    hyperedges = []
-    for i, _ in enumerate(ids): # individual_id_row is ids[i]
-        close_neighbors_mask = genetic_dist_df.iloc[i] < dist_threshold
-        close_neighbor_ids = genetic_dist_df.columns[close_neighbors_mask].tolist()
-        if len(close_neighbor_ids) >= min_size:
-            hyperedges.append(frozenset(close_neighbor_ids))
+def get_genetic_distance_threshold_hyperedges(genetic_dist_csr, ids, dist_threshold=0.2, min_size=2):
+    # genetic_dist_csr holds only pairs closer than GENETIC_DIST_CAP; ids maps its columns to individual IDs
+    if genetic_dist_csr.shape[0] == 0: print("Genetic distance matrix is empty."); return []
+    if dist_threshold > GENETIC_DIST_CAP:
+        print(f"Warning: dist_threshold {dist_threshold} exceeds GENETIC_DIST_CAP {GENETIC_DIST_CAP}; pairs beyond the cap are not considered.")
+    ids = np.asarray(ids, dtype=np.int32) # No copy when given genetic_dist_ids
+    close_mask = genetic_dist_csr.data < dist_threshold # Stored entries are already grouped by row
+    close_cols = genetic_dist_csr.indices[close_mask]
+    entry_rows = np.repeat(np.arange(genetic_dist_csr.shape[0]), np.diff(genetic_dist_csr.indptr))
+    counts = np.bincount(entry_rows[close_mask], minlength=genetic_dist_csr.shape[0])
+    neighbors_per_row = np.split(ids[close_cols], np.cumsum(counts)[:-1])
+    hyperedges = {tuple(np.sort(row_ids).tolist()) for row_ids, n in zip(neighbors_per_row, counts) if n >= min_size}
     # print(f"Generated {len(hyperedges)} genetic distance threshold hyperedges (threshold={dist_threshold}, min_size={min_size}).")
-    return unique_hyperedges(hyperedges)
+    return hyperedges
 
 def get_environment_hyperedges(individuals_df, environment_col='environment', individual_ids_col='individual_id', min_env_size=2):
     if individuals_df.empty or environment_col not in individuals_df.columns or individual_ids_col not in individuals_df.columns:
         print("Individuals DataFrame error or column missing for environment hyperedges."); return []
-    hyperedges = []
-    grouped_by_environment = individuals_df.groupby(environment_col)
-    for _, group in grouped_by_environment:
-        if len(group) >= min_env_size:
-            hyperedges.append(frozenset(group[individual_ids_col].values))
+    grouped_by_environment = individuals_df.sort_values(individual_ids_col).groupby(environment_col)[individual_ids_col]
+    env_sizes = grouped_by_environment.size()
+    hyperedges = set(grouped_by_environment.agg(tuple)[env_sizes >= min_env_size])
     # print(f"Generated {len(hyperedges)} environment-based hyperedges (min_env_size={min_env_size}).")
-    return unique_hyperedges(hyperedges)
+    return hyperedges
 
 def get_family_in_env_hyperedges(individuals_df, individual_ids_col='individual_id', family_id_col='family_id', environment_col='environment', min_size=2):
-    combined_hyperedges = []
     if family_id_col not in individuals_df.columns or environment_col not in individuals_df.columns or individual_ids_col not in individuals_df.columns:
         print("Individuals DataFrame missing required columns for family_in_env_hyperedges.")
         return []
-    valid_families = individuals_df[individuals_df[family_id_col] != -1]
-    for _, family_members in valid_families.groupby(family_id_col):
-        for _, members_in_env in family_members.groupby(environment_col):
-            if len(members_in_env) >= min_size:
-                 combined_hyperedges.append(frozenset(members_in_env[individual_ids_col]))
+    valid_families = individuals_df[individuals_df[family_id_col] != -1].sort_values(individual_ids_col)
+    # One compound groupby instead of a per-family groupby nested in a Python loop
+    grouped_by_family_env = valid_families.groupby([family_id_col, environment_col])[individual_ids_col]
+    family_env_sizes = grouped_by_family_env.size()
+    combined_hyperedges = set(grouped_by_family_env.agg(tuple)[family_env_sizes >= min_size])
     # print(f"Generated {len(combined_hyperedges)} family-in-environment hyperedges (min_size={min_size}).")
-    return unique_hyperedges(combined_hyperedges)
+    return combined_hyperedges
 
 # --- Example Usage: Generate various hyperedges from loaded data ---
 print("\n--- Generating Hyperedges from Loaded Data ---")
-all_hyperedges_from_loaded = []
+all_hyperedges_from_loaded = set() # Single accumulator: each hyperedge is hashed once, duplicates across categories never stored
 generated_hyperedge_counts = {}
 
+# Each category is an independent task: name -> (generator, positional args, keyword args), in merge order
+hyperedge_tasks = {}
+
 # Trait-based
 if not traits_df.empty:
-    trait_knn_h_loaded = get_trait_knn_hyperedges(traits_df, k=3, scale_traits=True)
-    all_hyperedges_from_loaded.extend(trait_knn_h_loaded)
-    generated_hyperedge_counts['trait_knn'] = len(trait_knn_h_loaded)
+    hyperedge_tasks['trait_knn'] = (get_trait_knn_hyperedges, (traits_df,), {'k': 3, 'scale_traits': True})
     
     # Example threshold - adjust based on your actual loaded traits_df['trait_0'] distribution
     # trait_0_median = traits_df['trait_0'].median()
-    # trait_thresh_h_loaded = get_trait_threshold_hyperedges(traits_df, 'trait_0', threshold=trait_0_median, mode='above')
-    # if trait_thresh_h_loaded: all_hyperedges_from_loaded.extend(trait_thresh_h_loaded); generated_hyperedge_counts['trait_thresh'] = len(trait_thresh_h_loaded)
+    # hyperedge_tasks['trait_thresh'] = (get_trait_threshold_hyperedges, (traits_df, 'trait_0'), {'threshold': trait_0_median, 'mode': 'above'})
 else:
     print("Skipping trait-based hyperedges as traits_df is empty or not loaded correctly.")
 
 # Genetic-based
 if not genetic_dist_df.empty:
-    genetic_knn_h_loaded = get_genetic_knn_hyperedges(genetic_dist_df, k=3)
-    all_hyperedges_from_loaded.extend(genetic_knn_h_loaded)
-    generated_hyperedge_counts['genetic_knn'] = len(genetic_knn_h_loaded)
+    hyperedge_tasks['genetic_knn'] = (get_genetic_knn_hyperedges, (genetic_dist_df,), {'k': 3, 'backend': GENETIC_KNN_BACKEND})
     
-    # Adjust threshold based on your actual loaded genetic_dist_df values
-    # genetic_dist_thresh_h_loaded = get_genetic_distance_threshold_hyperedges(genetic_dist_df, dist_threshold=0.25, min_size=2)
-    # if genetic_dist_thresh_h_loaded: all_hyperedges_from_loaded.extend(genetic_dist_thresh_h_loaded); generated_hyperedge_counts['genetic_dist_thresh'] = len(genetic_dist_thresh_h_loaded)
+    # Adjust threshold based on your actual loaded genetic_dist_df values (must stay below GENETIC_DIST_CAP)
+    if GENETIC_DIST_THRESH_ENABLED:
+        hyperedge_tasks['genetic_dist_thresh'] = (get_genetic_distance_threshold_hyperedges, (genetic_dist_csr, genetic_dist_ids), {'dist_threshold': 0.25, 'min_size': 2})
 else:
     print("Skipping genetic k-NN/distance threshold hyperedges as genetic_dist_df is empty or not loaded correctly.")
 
 if not individuals_df.empty:
-    family_h_loaded = get_family_hyperedges(individuals_df, min_family_size=2)
-    all_hyperedges_from_loaded.extend(family_h_loaded)
-    generated_hyperedge_counts['family'] = len(family_h_loaded)
-    
-    env_h_loaded = get_environment_hyperedges(individuals_df, min_env_size=2)
-    all_hyperedges_from_loaded.extend(env_h_loaded)
-    generated_hyperedge_counts['environment'] = len(env_h_loaded)
-
-    family_env_h_loaded = get_family_in_env_hyperedges(individuals_df)
-    all_hyperedges_from_loaded.extend(family_env_h_loaded)
-    generated_hyperedge_counts['family_in_env'] = len(family_env_h_loaded)
+    hyperedge_tasks['family'] = (get_family_hyperedges, (individuals_df,), {'min_family_size': 2})
+    hyperedge_tasks['environment'] = (get_environment_hyperedges, (individuals_df,), {'min_env_size': 2})
+    hyperedge_tasks['family_in_env'] = (get_family_in_env_hyperedges, (individuals_df,), {})
 else:
     print("Skipping family, environment, and family-in-environment hyperedges as individuals_df is empty or not loaded correctly.")
 
+# The parallel numba kernel hangs at exit when first started from a worker thread, so that task runs here on the main thread
+main_thread_results = {}
+if GENETIC_KNN_BACKEND == 'numba' and NUMBA_AVAILABLE and 'genetic_knn' in hyperedge_tasks:
+    fn, args, kwargs = hyperedge_tasks['genetic_knn']
+    main_thread_results['genetic_knn'] = fn(*args, **kwargs)
+
+# Run the remaining generators concurrently; results are merged in task order so the output does not depend on scheduling
+with ThreadPoolExecutor(max_workers=HYPEREDGE_N_WORKERS) as executor:
+    hyperedge_futures = {name: executor.submit(fn, *args, **kwargs) for name, (fn, args, kwargs) in hyperedge_tasks.items() if name not in main_thread_results}
+    for name in hyperedge_tasks:
+        category_hyperedges = main_thread_results[name] if name in main_thread_results else hyperedge_futures[name].result()
+        all_hyperedges_from_loaded.update(category_hyperedges)
+        generated_hyperedge_counts[name] = len(category_hyperedges)
+
 # Print summary of generated hyperedges
 print("\nSummary of generated hyperedge counts:")
 for k, v in generated_hyperedge_counts.items():
     print(f"- {k}: {v}")
 
-# Consolidate all unique hyperedges
-final_hyperedge_list_loaded = unique_hyperedges(all_hyperedges_from_loaded)
+# All hyperedges are already unique in the accumulator set
+final_hyperedge_list_loaded = list(all_hyperedges_from_loaded)
 print(f"\nTotal number of unique hyperedges generated from loaded data: {len(final_hyperedge_list_loaded)}")
 
 if final_hyperedge_list_loaded:
-    print(f"Example of a few hyperedges (sets of individual_ids):")
+    print(f"Example of a few hyperedges (sorted tuples of individual_ids):")
     for i, h_edge in enumerate(final_hyperedge_list_loaded[:min(3, len(final_hyperedge_list_loaded))]):
         print(f"Hyperedge {i}: {h_edge}")
 else:
     print("No hyperedges were generated from loaded data. Check data loading and parameters.")
 
 # --- Save the final hyperedge list to a JSON file ---
-hyperedges_for_json = [list(map(int, he)) for he in final_hyperedge_list_loaded] # Ensure all IDs are standard Python ints
+hyperedges_for_json = final_hyperedge_list_loaded # Sorted tuples of Python ints serialize as JSON arrays as-is
 
 print(f"\nAttempting to save {len(hyperedges_for_json)} hyperedges to {HYPEREDGES_FILE}.") # Added this line
 
@@ -206,8 +288,12 @@ if not hyperedges_for_json:
         print(f"An error occurred while saving an empty hyperedge list to JSON: {e}")
 else:
     try:
-        with open(HYPEREDGES_FILE, 'w') as f:
-            json.dump(hyperedges_for_json, f)
+        if ORJSON_AVAILABLE:
+            with open(HYPEREDGES_FILE, 'wb') as f:
+                f.write(orjson.dumps(hyperedges_for_json, option=orjson.OPT_SERIALIZE_NUMPY)) # orjson's encode error is a TypeError subclass
+        else:
+            with open(HYPEREDGES_FILE, 'w') as f:
+                json.dump(hyperedges_for_json, f)
         print(f"Saved final list of {len(hyperedges_for_json)} hyperedges to {HYPEREDGES_FILE}")
     except TypeError as te:
         print(f"TypeError during JSON dump: {te}. This might indicate non-serializable data within the hyperedges.")
@@ -1,6 +1,7 @@
 # SCRIPT 3: Loading Hyperedges, Constructing H, and SAVING H's Structure
 
 import json
+import pickle
 import hypernetx as hnx
 
 # --- Input Filename for Hyperedges (must match output from Script 2) ---
@@ -8,6 +9,7 @@ HYPEREDGES_FILE = 'simulated_hyperedges.json'
 
 # --- Output Filename for the Hypergraph's Essential Structure ---
 HYPERGRAPH_STRUCTURE_FILE = 'hypergraph_structure.json'
+HYPERGRAPH_PICKLE_FILE = 'hypergraph_structure.pkl' # Binary incidence dict, loaded by Script 4 without JSON parsing
 
 # --- Load Hyperedges from JSON file ---
 print("SCRIPT 3: Loading hyperedges from file...")
@@ -18,18 +20,25 @@ try:
     with open(HYPEREDGES_FILE, 'r') as f:
         loaded_hyperedges_as_lists = json.load(f)
     
-    hyperedges_for_hnx_constructor = []
+    # Convert each edge once; an edge with a member int() rejects is skipped on its own, and empty hyperedges silently.
+    # Identical member sets are de-duplicated up front (first-seen order kept) so HNX does not have to.
+    unique_hyperedges = {}
+    n_valid_hyperedges = 0
     for i_he, he_list in enumerate(loaded_hyperedges_as_lists):
         try:
-            # Ensure all elements are integers and form a set
-            current_edge = set(map(int, he_list))
-            if not current_edge: # Skip empty hyperedges if any were accidentally created/loaded
-                # print(f"Warning: Skipping empty hyperedge at index {i_he} from input file.")
-                continue
-            hyperedges_for_hnx_constructor.append(current_edge)
-        except ValueError as ve:
+            current_edge = frozenset(map(int, he_list))
+        except (TypeError, ValueError) as ve:
             print(f"Warning: Found non-integer data in hyperedge list: {he_list} at index {i_he}. Skipping this hyperedge. Error: {ve}")
             continue
+        if not current_edge:
+            continue
+        n_valid_hyperedges += 1
+        unique_hyperedges.setdefault(current_edge)
+    # Sort each edge's members once here and give every edge an explicit UID (its position), so the save step can
+    # look the sorted lists up by UID instead of relying on HNX's own UID assignment
+    hyperedges_for_hnx_constructor = {edge_uid: sorted(edge) for edge_uid, edge in enumerate(unique_hyperedges)}
+    if len(hyperedges_for_hnx_constructor) < n_valid_hyperedges:
+        print(f"Removed {n_valid_hyperedges - len(hyperedges_for_hnx_constructor)} duplicate hyperedges.")
     
     if not hyperedges_for_hnx_constructor:
         print("Warning: No valid hyperedges were loaded/processed from the file for HNX constructor.")
@@ -74,6 +83,9 @@ if hyperedges_for_hnx_constructor:
             # The values in H.incidence_dict (for these keys) should be the sets of nodes.
             edge_uids_from_H = list(H.edges)
             for edge_uid in edge_uids_from_H:
+                if edge_uid in hyperedges_for_hnx_constructor: # UID -> sorted int list from load time: no per-edge sort
+                    processed_hyperedges_list.append(hyperedges_for_hnx_constructor[edge_uid])
+                    continue
                 edge_members = H.incidence_dict.get(edge_uid) # Use .get() for safety
                 if edge_members is not None and hasattr(edge_members, '__iter__'):
                     try:
@@ -116,15 +128,25 @@ if hyperedges_for_hnx_constructor:
             json.dump(hypergraph_structure_data, f_json_out, indent=2)
         
         print(f"Hypergraph structure (nodes and {len(processed_hyperedges_list)} hyperedges) saved to {HYPERGRAPH_STRUCTURE_FILE}.")
+
+        # Also pickle the incidence dict (edge UID -> members) as-is: no per-edge sort or JSON encoding needed
+        if hasattr(H, 'incidence_dict') and isinstance(H.incidence_dict, dict):
+            incidence_dict_to_save = H.incidence_dict
+        else:
+            incidence_dict_to_save = dict(enumerate(processed_hyperedges_list))
+        with open(HYPERGRAPH_PICKLE_FILE, 'wb') as f_pkl_out:
+            pickle.dump({"nodes": nodes_list, "edges": incidence_dict_to_save}, f_pkl_out, protocol=5)
+        print(f"Hypergraph incidence dict ({len(incidence_dict_to_save)} hyperedges) pickled to {HYPERGRAPH_PICKLE_FILE}.")
+
         print(f"In the next script (Script 4), you can load this file, and reconstruct H using:")
-        print(f"  import json, hypernetx as hnx")
-        print(f"  with open('{HYPERGRAPH_STRUCTURE_FILE}', 'r') as f:")
-        print(f"      data = json.load(f)")
-        print(f"  H_loaded = hnx.Hypergraph(data['hyperedges'])")
+        print(f"  import pickle, hypernetx as hnx")
+        print(f"  with open('{HYPERGRAPH_PICKLE_FILE}', 'rb') as f:")
+        print(f"      data = pickle.load(f)")
+        print(f"  H_loaded = hnx.Hypergraph(data['edges'])")
 
     except Exception as e_construct_or_save:
         print(f"An critical error occurred during HyperNetX Hypergraph processing or saving its structure: {e_construct_or_save}")
 else:
     print("\nSkipping Hypergraph construction and saving as no valid hyperedges were loaded/processed.")
 
-print("\nSCRIPT 3: Hypergraph construction and structure saving attempt complete.")x
\ No newline at end of file
+print("\nSCRIPT 3: Hypergraph construction and structure saving attempt complete.")
\ No newline at end of file
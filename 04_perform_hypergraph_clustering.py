@@ -1,7 +1,11 @@
 # SCRIPT 4: Loading Hypergraph, Clustering, and Saving Assignments
 
 import json
+import os
+import pickle
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import hypernetx as hnx
 # Attempt to import the hypergraph_modularity module
 try:
@@ -16,10 +20,17 @@ except ImportError:
 except Exception as e:
     print(f"An unexpected error occurred importing hypergraph_modularity: {e}")
     HMOD_AVAILABLE = False
+# python-igraph is only used for the fallback clustering of the weighted 2-section
+try:
+    import igraph as ig
+    IGRAPH_AVAILABLE = True
+except ImportError:
+    IGRAPH_AVAILABLE = False
 
 
 # --- Input Filename (from Script 3) ---
 HYPERGRAPH_STRUCTURE_FILE = 'hypergraph_structure.json'
+HYPERGRAPH_PICKLE_FILE = 'hypergraph_structure.pkl' # Preferred over the JSON file when present
 
 # --- Output Filename for Cluster Assignments ---
 CLUSTER_ASSIGNMENTS_FILE = 'hypergraph_cluster_assignments.csv'
@@ -31,24 +42,34 @@ nodes_from_file = []
 hyperedges_from_file = []
 
 try:
-    with open(HYPERGRAPH_STRUCTURE_FILE, 'r') as f:
-        data = json.load(f)
-    
-    nodes_from_file = data.get('nodes', [])
-    raw_hyperedges = data.get('hyperedges', [])
-    
-    # Convert hyperedges to sets of integers for HNX constructor
-    hyperedges_for_hnx_constructor = []
-    for i_he, he_list in enumerate(raw_hyperedges):
-        try:
-            current_edge = set(map(int, he_list))
-            if not current_edge:
-                # print(f"Warning: Skipping empty hyperedge at index {i_he} from loaded structure.")
+    # The pickle is used only while it is at least as new as the JSON, so a JSON rewritten on its own is not shadowed
+    use_hypergraph_pickle = os.path.exists(HYPERGRAPH_PICKLE_FILE) and (
+        not os.path.exists(HYPERGRAPH_STRUCTURE_FILE) or os.path.getmtime(HYPERGRAPH_PICKLE_FILE) >= os.path.getmtime(HYPERGRAPH_STRUCTURE_FILE))
+    if use_hypergraph_pickle:
+        # Fast path: the incidence dict (edge UID -> member node IDs) pickled by Script 3 feeds HNX directly
+        with open(HYPERGRAPH_PICKLE_FILE, 'rb') as f:
+            data = pickle.load(f)
+        nodes_from_file = data.get('nodes', [])
+        hyperedges_for_hnx_constructor = {edge_uid: members for edge_uid, members in data.get('edges', {}).items() if members}
+    else:
+        with open(HYPERGRAPH_STRUCTURE_FILE, 'r') as f:
+            data = json.load(f)
+        
+        nodes_from_file = data.get('nodes', [])
+        raw_hyperedges = data.get('hyperedges', [])
+        
+        # Convert hyperedges to sets of integers for HNX constructor
+        hyperedges_for_hnx_constructor = []
+        for i_he, he_list in enumerate(raw_hyperedges):
+            try:
+                current_edge = set(map(int, he_list))
+                if not current_edge:
+                    # print(f"Warning: Skipping empty hyperedge at index {i_he} from loaded structure.")
+                    continue
+                hyperedges_for_hnx_constructor.append(current_edge)
+            except ValueError as ve:
+                print(f"Warning: Non-integer data in loaded hyperedge: {he_list}. Error: {ve}. Skipping.")
                 continue
-            hyperedges_for_hnx_constructor.append(current_edge)
-        except ValueError as ve:
-            print(f"Warning: Non-integer data in loaded hyperedge: {he_list}. Error: {ve}. Skipping.")
-            continue
             
     if not hyperedges_for_hnx_constructor:
         print("Error: No valid hyperedges found in the loaded structure file to construct H.")
@@ -63,10 +84,24 @@ except FileNotFoundError:
 except json.JSONDecodeError:
     print(f"Error: Could not decode JSON from {HYPERGRAPH_STRUCTURE_FILE}.")
     exit()
+except pickle.UnpicklingError:
+    print(f"Error: Could not unpickle {HYPERGRAPH_PICKLE_FILE}. Delete it to fall back to {HYPERGRAPH_STRUCTURE_FILE}.")
+    exit()
 except Exception as e:
     print(f"An error occurred while loading or reconstructing H: {e}")
     exit()
 
+# --- Sparse Incidence Matrix (built only for the fallback clustering) ---
+def build_incidence_matrix(edge_member_lists):
+    # B is the (nodes x hyperedges) incidence matrix in CSR form; degrees, edge sizes and co-membership counts (B @ B.T)
+    # then come from sparse C-level operations rather than HNX's Python dicts. Row i of B is individual incidence_node_ids[i].
+    edge_sizes = np.fromiter(map(len, edge_member_lists), dtype=np.int64, count=len(edge_member_lists))
+    member_ids = np.fromiter((int(node) for members in edge_member_lists for node in members), dtype=np.int64, count=edge_sizes.sum())
+    incidence_node_ids = np.unique(member_ids)
+    B = sp.csr_matrix((np.ones(len(member_ids)), (np.searchsorted(incidence_node_ids, member_ids), np.repeat(np.arange(len(edge_member_lists)), edge_sizes))),
+                      shape=(len(incidence_node_ids), len(edge_member_lists)))
+    return B, incidence_node_ids, edge_sizes
+
 # --- Apply Hypergraph Clustering Algorithm ---
 cluster_assignments_df = pd.DataFrame()
 
@@ -81,14 +116,15 @@ if H and HMOD_AVAILABLE:
             print(f"Kumar's algorithm resulted in {len(partition)} clusters.")
             
             # Convert partition (list of sets) to a DataFrame: individual_id, cluster_id
-            node_to_cluster = {}
+            # Node IDs are small non-negative ints, so a dense array indexed by ID replaces a node -> cluster dict
+            max_node_id = max((int(node) for node_set in partition for node in node_set), default=-1)
+            cluster_ids = np.full(max_node_id + 1, -1, dtype=np.int32)
             for cluster_idx, node_set in enumerate(partition):
-                for node in node_set:
-                    node_to_cluster[int(node)] = cluster_idx # Ensure node is int for merging
+                cluster_ids[np.fromiter(node_set, dtype=np.int32, count=len(node_set))] = cluster_idx
+            assigned_ids = np.flatnonzero(cluster_ids >= 0) # Already sorted by individual_id
             
-            if node_to_cluster:
-                cluster_assignments_df = pd.DataFrame(list(node_to_cluster.items()), columns=['individual_id', 'cluster_id'])
-                cluster_assignments_df = cluster_assignments_df.sort_values(by='individual_id').reset_index(drop=True)
+            if assigned_ids.size > 0:
+                cluster_assignments_df = pd.DataFrame({'individual_id': assigned_ids, 'cluster_id': cluster_ids[assigned_ids]})
                 
                 print(f"Successfully assigned {len(cluster_assignments_df)} individuals to clusters.")
                 print("Cluster assignments (first 5 rows):")
@@ -110,8 +146,35 @@ if H and HMOD_AVAILABLE:
 
 elif not H:
     print("\nSkipping clustering as Hypergraph H was not reconstructed.")
+elif not HMOD_AVAILABLE and IGRAPH_AVAILABLE:
+    print("\nKumar's algorithm is not available. Falling back to Louvain modularity clustering of the weighted 2-section (B @ B.T) with igraph...")
+    try:
+        edge_member_lists = list(hyperedges_for_hnx_constructor.values()) if isinstance(hyperedges_for_hnx_constructor, dict) else hyperedges_for_hnx_constructor
+        B, incidence_node_ids, edge_sizes = build_incidence_matrix(edge_member_lists)
+        node_degrees = np.asarray(B.sum(axis=1)).ravel()
+        print(f"Sparse incidence matrix B: {B.shape[0]} nodes x {B.shape[1]} hyperedges, {B.nnz} incidences.")
+        print(f"Node degree mean/max: {node_degrees.mean():.2f}/{node_degrees.max():.0f}. Hyperedge size mean/max: {edge_sizes.mean():.2f}/{edge_sizes.max()}.")
+
+        # Edge weight = shared hyperedges, each scaled by 1/(size - 1) so large hyperedges do not swamp small ones
+        edge_scaling = sp.diags(1.0 / np.maximum(edge_sizes - 1, 1))
+        co_membership = sp.triu(B @ edge_scaling @ B.T, k=1).tocoo()
+        G_weighted = ig.Graph(n=B.shape[0], edges=np.column_stack((co_membership.row, co_membership.col)).tolist(),
+                              edge_attrs={'weight': co_membership.data.tolist()})
+        membership = np.asarray(G_weighted.community_multilevel(weights='weight').membership)
+        print(f"Louvain clustering resulted in {membership.max() + 1} clusters.")
+
+        cluster_assignments_df = pd.DataFrame({'individual_id': incidence_node_ids, 'cluster_id': membership})
+        print(f"Successfully assigned {len(cluster_assignments_df)} individuals to clusters.")
+        print("Cluster assignments (first 5 rows):")
+        print(cluster_assignments_df.head())
+
+        # Save cluster assignments
+        cluster_assignments_df.to_csv(CLUSTER_ASSIGNMENTS_FILE, index=False)
+        print(f"\nCluster assignments saved to {CLUSTER_ASSIGNMENTS_FILE}")
+    except Exception as e_louvain:
+        print(f"An error occurred during the fallback Louvain clustering: {e_louvain}")
 elif not HMOD_AVAILABLE:
-    print("\nSkipping Kumar's clustering as hypergraph_modularity module is not available.")
+    print("\nSkipping Kumar's clustering as hypergraph_modularity module is not available (and python-igraph is missing for the fallback).")
 
 
 if cluster_assignments_df.empty:
@@ -1,5 +1,6 @@
 # SCRIPT 5: Evaluating Hypergraph Clustering Results
 
+import numpy as np
 import pandas as pd
 from sklearn.metrics import adjusted_rand_score, adjusted_mutual_info_score
 from sklearn.metrics import homogeneity_score, completeness_score, v_measure_score
@@ -35,7 +36,11 @@ if 'individual_id' not in cluster_assignments_df.columns or 'individual_id' not
 # cluster_assignments_df['individual_id'] = cluster_assignments_df['individual_id'].astype(int)
 # individuals_df['individual_id'] = individuals_df['individual_id'].astype(int)
 
-merged_df = pd.merge(individuals_df, cluster_assignments_df, on='individual_id', how='inner')
+# individual_id is a dense integer key: align on the index instead of a column-on-column hash merge
+merged_df = individuals_df.set_index('individual_id').join(cluster_assignments_df.set_index('individual_id'), how='inner').reset_index()
+# Low-cardinality string labels: categoricals let groupby/crosstab work on integer codes
+merged_df['true_group'] = merged_df['true_group'].astype('category')
+merged_df['environment'] = merged_df['environment'].astype('category')
 
 if len(merged_df) != len(individuals_df):
     print(f"Warning: Merge resulted in {len(merged_df)} rows, but expected {len(individuals_df)}. Check for ID mismatches or duplicates.")
@@ -48,8 +53,11 @@ print("Merged DataFrame (first 5 rows):")
 print(merged_df.head())
 
 # --- Define True Labels and Predicted Cluster Labels ---
-true_labels = merged_df['true_group']
-predicted_labels = merged_df['cluster_id']
+# Factorize once; the integer codes feed every metric and the contingency table, so no step re-encodes the labels
+true_codes, true_group_labels = pd.factorize(merged_df['true_group'], sort=True)
+cluster_codes, cluster_labels = pd.factorize(merged_df['cluster_id'], sort=True)
+true_labels = true_codes
+predicted_labels = cluster_codes
 
 # --- Calculate Clustering Evaluation Metrics ---
 print("\n--- Clustering Performance Metrics (compared to 'true_group') ---")
@@ -70,7 +78,12 @@ except Exception as e:
 
 # --- Contingency Table (Cross-Tabulation) ---
 print("\n--- Contingency Table (True Groups vs. Found Clusters) ---")
-contingency_table = pd.crosstab(merged_df['true_group'], merged_df['cluster_id'], rownames=['True Group'], colnames=['Found Cluster'])
+# Count (true group, cluster) pairs with one bincount over the factorized codes; wrap in a DataFrame only for printing
+contingency_counts = np.bincount(true_codes * len(cluster_labels) + cluster_codes,
+                                 minlength=len(true_group_labels) * len(cluster_labels)).reshape(len(true_group_labels), len(cluster_labels))
+contingency_table = pd.DataFrame(contingency_counts,
+                                 index=pd.Index(np.asarray(true_group_labels), name='True Group'),
+                                 columns=pd.Index(np.asarray(cluster_labels), name='Found Cluster'))
 print(contingency_table)
 
 # --- Characterize Clusters ---
@@ -78,30 +91,42 @@ print("\n--- Cluster Characterization ---")
 found_clusters = sorted(merged_df['cluster_id'].unique())
 print(f"Found {len(found_clusters)} clusters: {found_clusters}")
 
+# Count (cluster, category) pairs in one pass each instead of re-filtering merged_df per cluster;
+# the true-group counts are just the transposed contingency table
+cluster_sizes = contingency_table.sum(axis=0)
+true_group_counts_by_cluster = contingency_table.T
+env_counts_by_cluster = merged_df.groupby(['cluster_id', 'environment'], observed=True).size().unstack(fill_value=0)
+# Family counts keep each cluster's first-appearance order, which is the order value_counts() breaks count ties in
+family_counts_long = merged_df[merged_df['family_id'] != -1].groupby(['cluster_id', 'family_id'], sort=False).size()
+family_counts_by_cluster = {cluster_val: counts.droplevel(0) for cluster_val, counts in family_counts_long.groupby(level=0, sort=False)}
+family_sizes = individuals_df['family_id'].value_counts()
+
 for cluster_val in found_clusters:
     print(f"\n--- Details for Found Cluster {cluster_val} ---")
-    cluster_data = merged_df[merged_df['cluster_id'] == cluster_val]
-    print(f"  Number of individuals: {len(cluster_data)}")
+    n_in_cluster = cluster_sizes[cluster_val]
+    print(f"  Number of individuals: {n_in_cluster}")
     
     print("  True Group Distribution:")
-    true_group_counts = cluster_data['true_group'].value_counts(normalize=True).sort_index()
-    for group, prop in true_group_counts.items():
-        print(f"    - {group}: {prop:.2%} ({cluster_data['true_group'].value_counts()[group]} individuals)")
+    true_group_counts = true_group_counts_by_cluster.loc[cluster_val]
+    for group, count in true_group_counts[true_group_counts > 0].items():
+        print(f"    - {group}: {count / n_in_cluster:.2%} ({count} individuals)")
         
     print("  Environment Distribution:")
-    env_counts = cluster_data['environment'].value_counts(normalize=True).sort_index()
-    for env, prop in env_counts.items():
-        print(f"    - {env}: {prop:.2%} ({cluster_data['environment'].value_counts()[env]} individuals)")
+    env_counts = env_counts_by_cluster.loc[cluster_val]
+    for env, count in env_counts[env_counts > 0].items():
+        print(f"    - {env}: {count / n_in_cluster:.2%} ({count} individuals)")
 
     # Family representation (show if any family is significantly represented)
     # Only consider families with more than one member in this cluster for brevity
-    family_counts_in_cluster = cluster_data[cluster_data['family_id'] != -1]['family_id'].value_counts()
-    significant_families = family_counts_in_cluster[family_counts_in_cluster > 1]
+    if cluster_val in family_counts_by_cluster:
+        family_counts_in_cluster = family_counts_by_cluster[cluster_val].sort_values(ascending=False) # Same sort as value_counts()
+        significant_families = family_counts_in_cluster[family_counts_in_cluster > 1]
+    else:
+        significant_families = pd.Series(dtype=int)
     if not significant_families.empty:
         print("  Significant Family Representation (families with >1 member in this cluster):")
         for fam_id, count in significant_families.items():
-            total_fam_members = len(individuals_df[individuals_df['family_id'] == fam_id])
-            print(f"    - Family {fam_id}: {count} members (out of {total_fam_members} total in family)")
+            print(f"    - Family {fam_id}: {count} members (out of {family_sizes[fam_id]} total in family)")
     else:
         print("  No small families significantly represented (or only single members present).")
 
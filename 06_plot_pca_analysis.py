@@ -1,11 +1,14 @@
 # SCRIPT 6: Plotting PCA of Traits with Different Groupings
 
+import os
+import glob
+import hashlib
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
-import seaborn as sns
+import matplotlib.colors as mcolors
+from pipeline_utils import load_table, zscore_columns # Same CSV reader and trait scaling as Script 2
 
 # --- Input Filenames ---
 INDIVIDUALS_FILE = 'simulated_individuals.csv'      # From Script 1
@@ -17,11 +20,29 @@ PCA_PLOT_TRUE_GROUPS_FILE = 'pca_plot_true_groups.png'
 PCA_PLOT_FOUND_CLUSTERS_FILE = 'pca_plot_found_clusters.png'
 PCA_PLOT_ENVIRONMENT_FILE = 'pca_plot_environment.png'
 
+# --- PCA cache (components + explained variance, keyed by a hash of the scaled trait matrix and PCA_SETTINGS) ---
+PCA_CACHE_FILE_TEMPLATE = 'pca_cache_{key}.npz'
+PCA_SETTINGS = {'n_components': 2, 'svd_solver': 'randomized', 'random_state': 42} # Reduce to 2 principal components; truncated SVD only
+
+def scatter_by_category(x, y, codes, levels, cmap_name, point_colors, qualitative=True):
+    # Draws every point in one plt.scatter call, colored by precomputed category codes; returns legend handles in level order.
+    # point_colors is an (n_points, 4) buffer reused across plots (scatter keeps its own copy of the colors).
+    cmap = plt.get_cmap(cmap_name)
+    if qualitative: # First colors of the map in order, cycling when there are more levels than colors
+        level_colors = [cmap.colors[i % len(cmap.colors)] for i in range(len(levels))]
+    else: # Evenly spaced interior samples of a continuous map (both ends skipped, as seaborn's color_palette does)
+        level_colors = [cmap(v) for v in np.linspace(0, 1, len(levels) + 2)[1:-1]]
+    level_colors = np.array([mcolors.to_rgba(c) for c in level_colors])
+    np.take(level_colors, codes, axis=0, out=point_colors)
+    plt.scatter(x, y, c=point_colors, s=70, alpha=0.8, edgecolors='white', linewidths=0.5)
+    return [plt.Line2D([0], [0], marker='o', color='w', label=str(level), markerfacecolor=level_colors[i], markersize=8)
+            for i, level in enumerate(levels)]
+
 # --- Load Data ---
 print("SCRIPT 6: Generating PCA plots...")
 try:
-    individuals_df = pd.read_csv(INDIVIDUALS_FILE)
-    traits_df = pd.read_csv(TRAITS_FILE)
+    individuals_df = load_table(INDIVIDUALS_FILE)
+    traits_df = load_table(TRAITS_FILE)
     cluster_assignments_df = pd.read_csv(CLUSTER_ASSIGNMENTS_FILE)
     print("Data loaded successfully.")
 except FileNotFoundError as e:
@@ -54,32 +75,55 @@ if not trait_columns:
 x_traits = full_merged_df[trait_columns].values
 
 # 1. Scale the data
-scaler = StandardScaler()
-x_scaled = scaler.fit_transform(x_traits)
+x_scaled = zscore_columns(x_traits)
 
 # 2. Apply PCA
-pca = PCA(n_components=2, random_state=42) # Reduce to 2 principal components
-principal_components = pca.fit_transform(x_scaled)
-
-pca_df = pd.DataFrame(data=principal_components, columns=['PC1', 'PC2'])
-# Add the grouping columns for plotting
-pca_df['individual_id'] = full_merged_df['individual_id']
-pca_df['true_group'] = full_merged_df['true_group']
-pca_df['cluster_id'] = full_merged_df['cluster_id'].astype('category') # Treat as category for distinct colors
-pca_df['environment'] = full_merged_df['environment']
-
-print(f"\nPCA performed. Explained variance ratio by PC1: {pca.explained_variance_ratio_[0]:.3f}, PC2: {pca.explained_variance_ratio_[1]:.3f}")
-print(f"Total variance explained by first 2 PCs: {np.sum(pca.explained_variance_ratio_):.3f}")
+# Identical input (values and shape) and PCA settings give the same file name, so re-plotting skips the SVD
+pca_cache_key = hashlib.blake2b(np.ascontiguousarray(x_scaled).tobytes() + repr(x_scaled.shape).encode()
+                                + repr(sorted(PCA_SETTINGS.items())).encode(), digest_size=8).hexdigest()
+pca_cache_file = PCA_CACHE_FILE_TEMPLATE.format(key=pca_cache_key)
+if os.path.exists(pca_cache_file):
+    with np.load(pca_cache_file) as pca_cache:
+        principal_components = pca_cache['pc']
+        explained_variance_ratio = pca_cache['evr']
+    print(f"Loaded cached PCA from {pca_cache_file}")
+else:
+    pca = PCA(**PCA_SETTINGS)
+    principal_components = pca.fit_transform(x_scaled)
+    explained_variance_ratio = pca.explained_variance_ratio_
+    np.savez(pca_cache_file, pc=principal_components, evr=explained_variance_ratio)
+    # Only the cache for the current input is kept; entries for older data or settings are removed on write
+    for stale_cache_file in glob.glob(PCA_CACHE_FILE_TEMPLATE.format(key='*')):
+        if stale_cache_file != pca_cache_file:
+            os.remove(stale_cache_file)
+
+# Components plus the grouping columns for plotting, built in one allocation
+pca_df = pd.DataFrame({
+    'PC1': principal_components[:, 0],
+    'PC2': principal_components[:, 1],
+    'individual_id': full_merged_df['individual_id'].values,
+    'true_group': full_merged_df['true_group'].values,
+    'cluster_id': pd.Categorical(full_merged_df['cluster_id']), # Treat as category for distinct colors
+    'environment': full_merged_df['environment'].values,
+})
+
+print(f"\nPCA performed. Explained variance ratio by PC1: {explained_variance_ratio[0]:.3f}, PC2: {explained_variance_ratio[1]:.3f}")
+print(f"Total variance explained by first 2 PCs: {np.sum(explained_variance_ratio):.3f}")
 
 # --- Create PCA Plots ---
+# Hue columns are factorized once and one RGBA buffer is shared by all three plots. Level order follows seaborn:
+# numeric and categorical hues are sorted, string hues keep their order of first appearance
+hue_codes = {col: pd.factorize(pca_df[col], sort=isinstance(pca_df[col].dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(pca_df[col]))
+             for col in ['true_group', 'cluster_id', 'environment']}
+point_colors = np.empty((len(pca_df), 4))
 
 # Plot 1: Colored by True Group
 plt.figure(figsize=(10, 8))
-sns.scatterplot(x='PC1', y='PC2', hue='true_group', data=pca_df, palette='viridis', s=70, alpha=0.8)
+legend_handles = scatter_by_category(pca_df['PC1'], pca_df['PC2'], *hue_codes['true_group'], 'viridis', point_colors, qualitative=False)
 plt.title('PCA of Traits - Colored by True Group')
-plt.xlabel(f'Principal Component 1 ({pca.explained_variance_ratio_[0]*100:.1f}%)')
-plt.ylabel(f'Principal Component 2 ({pca.explained_variance_ratio_[1]*100:.1f}%)')
-plt.legend(title='True Group', bbox_to_anchor=(1.05, 1), loc='upper left')
+plt.xlabel(f'Principal Component 1 ({explained_variance_ratio[0]*100:.1f}%)')
+plt.ylabel(f'Principal Component 2 ({explained_variance_ratio[1]*100:.1f}%)')
+plt.legend(handles=legend_handles, title='True Group', bbox_to_anchor=(1.05, 1), loc='upper left')
 plt.grid(True, linestyle='--', alpha=0.7)
 plt.tight_layout(rect=[0, 0, 0.85, 1]) # Adjust layout to make space for legend
 plt.savefig(PCA_PLOT_TRUE_GROUPS_FILE)
@@ -90,14 +134,14 @@ print(f"\nSaved PCA plot colored by true groups to {PCA_PLOT_TRUE_GROUPS_FILE}")
 plt.figure(figsize=(10, 8))
 # Ensure cluster_id is treated as categorical for distinct colors
 # Using a qualitative palette suitable for categorical data
-num_clusters = len(pca_df['cluster_id'].unique())
-palette_clusters = sns.color_palette("Paired", n_colors=num_clusters) if num_clusters <= 12 else sns.color_palette("tab20", n_colors=num_clusters)
+num_clusters = len(hue_codes['cluster_id'][1])
+palette_clusters = 'Paired' if num_clusters <= 12 else 'tab20'
 
-sns.scatterplot(x='PC1', y='PC2', hue='cluster_id', data=pca_df, palette=palette_clusters, s=70, alpha=0.8)
+legend_handles = scatter_by_category(pca_df['PC1'], pca_df['PC2'], *hue_codes['cluster_id'], palette_clusters, point_colors)
 plt.title('PCA of Traits - Colored by Found Hypergraph Cluster ID')
-plt.xlabel(f'Principal Component 1 ({pca.explained_variance_ratio_[0]*100:.1f}%)')
-plt.ylabel(f'Principal Component 2 ({pca.explained_variance_ratio_[1]*100:.1f}%)')
-plt.legend(title='Found Cluster ID', bbox_to_anchor=(1.05, 1), loc='upper left')
+plt.xlabel(f'Principal Component 1 ({explained_variance_ratio[0]*100:.1f}%)')
+plt.ylabel(f'Principal Component 2 ({explained_variance_ratio[1]*100:.1f}%)')
+plt.legend(handles=legend_handles, title='Found Cluster ID', bbox_to_anchor=(1.05, 1), loc='upper left')
 plt.grid(True, linestyle='--', alpha=0.7)
 plt.tight_layout(rect=[0, 0, 0.85, 1])
 plt.savefig(PCA_PLOT_FOUND_CLUSTERS_FILE)
@@ -106,11 +150,11 @@ print(f"Saved PCA plot colored by found clusters to {PCA_PLOT_FOUND_CLUSTERS_FIL
 
 # Plot 3: Colored by Environment
 plt.figure(figsize=(10, 8))
-sns.scatterplot(x='PC1', y='PC2', hue='environment', data=pca_df, palette='Set2', s=70, alpha=0.8)
+legend_handles = scatter_by_category(pca_df['PC1'], pca_df['PC2'], *hue_codes['environment'], 'Set2', point_colors)
 plt.title('PCA of Traits - Colored by Environment')
-plt.xlabel(f'Principal Component 1 ({pca.explained_variance_ratio_[0]*100:.1f}%)')
-plt.ylabel(f'Principal Component 2 ({pca.explained_variance_ratio_[1]*100:.1f}%)')
-plt.legend(title='Environment', bbox_to_anchor=(1.05, 1), loc='upper left')
+plt.xlabel(f'Principal Component 1 ({explained_variance_ratio[0]*100:.1f}%)')
+plt.ylabel(f'Principal Component 2 ({explained_variance_ratio[1]*100:.1f}%)')
+plt.legend(handles=legend_handles, title='Environment', bbox_to_anchor=(1.05, 1), loc='upper left')
 plt.grid(True, linestyle='--', alpha=0.7)
 plt.tight_layout(rect=[0, 0, 0.85, 1])
 plt.savefig(PCA_PLOT_ENVIRONMENT_FILE)
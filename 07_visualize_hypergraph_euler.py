@@ -1,14 +1,18 @@
 # SCRIPT 7: Plotting the Hypergraph using HyperNetX
 
+import os
 import json
+import pickle
 import pandas as pd
 import hypernetx as hnx
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm 
 import networkx as nx 
+from pipeline_utils import load_table # Same Parquet-cached CSV reader as Script 2
 
 # --- Input Filenames ---
 HYPERGRAPH_STRUCTURE_FILE = 'hypergraph_structure.json' 
+HYPERGRAPH_PICKLE_FILE = 'hypergraph_structure.pkl' # Incidence dict from Script 3; used instead of the JSON when present
 INDIVIDUALS_FILE = 'simulated_individuals.csv'      
 
 # --- Output Plot Filename ---
@@ -18,18 +22,27 @@ HYPERGRAPH_PLOT_FILE = 'hypergraph_visualization.png'
 print("SCRIPT 7: Loading hypergraph structure and reconstructing H...")
 H = None
 try:
-    with open(HYPERGRAPH_STRUCTURE_FILE, 'r') as f:
-        data = json.load(f)
-    raw_hyperedges = data.get('hyperedges', [])
-    hyperedges_for_hnx_constructor = []
-    for i_he, he_list in enumerate(raw_hyperedges):
-        try:
-            current_edge = set(map(int, he_list))
-            if not current_edge: continue
-            hyperedges_for_hnx_constructor.append(current_edge)
-        except ValueError as ve:
-            print(f"Warning: Non-integer data in loaded hyperedge: {he_list}. Error: {ve}. Skipping.")
-            continue
+    # The pickle is used only while it is at least as new as the JSON, so a JSON rewritten on its own is not shadowed
+    use_hypergraph_pickle = os.path.exists(HYPERGRAPH_PICKLE_FILE) and (
+        not os.path.exists(HYPERGRAPH_STRUCTURE_FILE) or os.path.getmtime(HYPERGRAPH_PICKLE_FILE) >= os.path.getmtime(HYPERGRAPH_STRUCTURE_FILE))
+    if use_hypergraph_pickle:
+        # Members are already validated int lists, so no per-edge parsing or set building is needed
+        with open(HYPERGRAPH_PICKLE_FILE, 'rb') as f:
+            data = pickle.load(f)
+        hyperedges_for_hnx_constructor = {edge_uid: members for edge_uid, members in data.get('edges', {}).items() if members}
+    else:
+        with open(HYPERGRAPH_STRUCTURE_FILE, 'r') as f:
+            data = json.load(f)
+        raw_hyperedges = data.get('hyperedges', [])
+        hyperedges_for_hnx_constructor = []
+        for i_he, he_list in enumerate(raw_hyperedges):
+            try:
+                current_edge = set(map(int, he_list))
+                if not current_edge: continue
+                hyperedges_for_hnx_constructor.append(current_edge)
+            except ValueError as ve:
+                print(f"Warning: Non-integer data in loaded hyperedge: {he_list}. Error: {ve}. Skipping.")
+                continue
     if not hyperedges_for_hnx_constructor:
         print("Error: No valid hyperedges found to construct H.")
         exit()
@@ -47,7 +60,7 @@ legend_elements_data = {}
 node_colors_list_for_draw = None 
 
 try:
-    individuals_df = pd.read_csv(INDIVIDUALS_FILE)
+    individuals_df = load_table(INDIVIDUALS_FILE)
     unique_true_groups = sorted(individuals_df['true_group'].unique())
     
     if len(unique_true_groups) <= 10: palette = cm.get_cmap('Paired', len(unique_true_groups))
@@ -57,17 +70,12 @@ try:
     group_to_color_map = {group: palette(i) for i, group in enumerate(unique_true_groups)}
     legend_elements_data = group_to_color_map
 
-    temp_node_colors_list = []
     h_nodes_list = list(H.nodes) 
-    for node_id in h_nodes_list:
-        # Find the true_group for the node_id
-        # Ensure individual_id in individuals_df is the same type as node_id from H.nodes for matching
-        node_info = individuals_df[individuals_df['individual_id'] == int(node_id)]
-        if not node_info.empty:
-            true_group = node_info['true_group'].iloc[0]
-            temp_node_colors_list.append(group_to_color_map.get(true_group, 'grey'))
-        else:
-            temp_node_colors_list.append('grey') # Default if node_id not in individuals_df
+    # One hash-based lookup of true_group for every node, in H.nodes order
+    # (node IDs cast to int to match individual_id; IDs missing from individuals_df come back as NaN and get 'grey')
+    group_by_individual = individuals_df.drop_duplicates('individual_id').set_index('individual_id')['true_group']
+    node_true_groups = group_by_individual.reindex([int(node_id) for node_id in h_nodes_list]).values
+    temp_node_colors_list = [group_to_color_map.get(true_group, 'grey') for true_group in node_true_groups]
     
     if len(temp_node_colors_list) == len(H.nodes):
         node_colors_list_for_draw = temp_node_colors_list
@@ -1,10 +1,55 @@
 # SCRIPT 8: Plotting the 2-Section Graph of the Hypergraph
 
 import json
+import os
+import glob
+import hashlib
+import multiprocessing
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+from scipy.optimize import minimize
 import networkx as nx
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
+import matplotlib
+import matplotlib.colors as mcolors
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+# Figures are built on an Agg canvas directly: plots are only saved to file, so pyplot's GUI backend and figure registry are not needed
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+# Numba is optional: it compiles the pair emission for PAIR_BACKEND = 'numba' and the Fruchterman-Reingold step for LAYOUT_METHOD = 'numba_fr'
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+# fa2_modified is optional: ForceAtlas2 with Barnes-Hut repulsion for LAYOUT_METHOD = 'forceatlas2'
+try:
+    from fa2_modified import ForceAtlas2
+    FA2_AVAILABLE = True
+except ImportError:
+    FA2_AVAILABLE = False
+# datashader is optional: it rasterizes nodes and edges when RENDER_BACKEND = 'datashader'
+try:
+    import datashader as ds
+    import datashader.transfer_functions as tf
+    from datashader.bundling import connect_edges
+    DATASHADER_AVAILABLE = True
+except ImportError:
+    DATASHADER_AVAILABLE = False
+# orjson is optional: it parses the integer-heavy structure file in C; the stdlib json module is used otherwise
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+# pyarrow is optional: it backs pandas' multithreaded CSV engine; the default C engine is used otherwise
+try:
+    import pyarrow # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 # --- Input Filenames ---
 HYPERGRAPH_STRUCTURE_FILE = 'hypergraph_structure.json' # From Script 3
@@ -14,17 +59,57 @@ CLUSTER_ASSIGNMENTS_FILE = 'hypergraph_cluster_assignments.csv' # From Script 4
 # --- Output Plot Filenames ---
 TWASECTION_PLOT_TRUE_GROUPS_FILE = '2section_plot_true_groups.png'
 TWASECTION_PLOT_FOUND_CLUSTERS_FILE = '2section_plot_found_clusters.png'
+INCIDENCE_PLOT_TRUE_GROUPS_FILE = 'incidence_plot_true_groups.png'
+INCIDENCE_PLOT_FOUND_CLUSTERS_FILE = 'incidence_plot_found_clusters.png'
+
+# --- 2-Section Construction ---
+GRAPH_VIEW = '2section' # '2section' (individuals linked when they share a hyperedge) or 'incidence' (bipartite individual-hyperedge
+                        # graph with hidden hyperedge nodes; far fewer edges to lay out and draw for large hyperedges)
+PAIR_BACKEND = 'numpy' # 'numpy' (one triu_indices block per hyperedge) or 'numba' (JIT-compiled loop over all hyperedges, requires numba)
+
+# --- Rendering Parameters ---
+RENDER_BACKEND = 'matplotlib' # 'matplotlib' (one LineCollection for the edges, one scatter for the nodes) or 'datashader' (pixel raster, requires datashader)
+RASTER_WIDTH, RASTER_HEIGHT = 1400, 1100 # Raster size in pixels for 'datashader'
+RASTER_NODE_SPREAD = 4 # Node marker radius in pixels for 'datashader'
+PLOT_DPI = 120
+PLOT_MAX_EDGES = 50_000 # 'matplotlib' draws a uniform random sample of this many edges from denser graphs (all nodes are still drawn)
+PLOT_EDGE_SAMPLE_SEED = 0
+PLOT_N_WORKERS = 2 # Processes rendering the plots concurrently (1 = draw them one at a time)
+
+# --- Layout Parameters ---
+LAYOUT_CACHE_FILE_TEMPLATE = 'layout_cache_{key}.npy' # Node positions of a previous run with the same graph and settings
+LAYOUT_METHOD = 'lbfgs' # 'lbfgs' (L-BFGS minimization of the Fruchterman-Reingold energy), 'numba_fr' (JIT-compiled
+                        # Fruchterman-Reingold iterations, requires numba), 'forceatlas2' (Barnes-Hut ForceAtlas2,
+                        # requires fa2_modified) or 'spring' (nx.spring_layout)
+LAYOUT_K = 0.2 # Optimal distance between nodes (same role as spring_layout's k)
+LAYOUT_MAX_ITER = 200 # L-BFGS iterations
+LAYOUT_GRAVITY = 0.01 # Weak pull toward the origin so isolated nodes and separate components stay in frame
+LAYOUT_BLOCK_ROWS = 1024 # Rows per block in the all-pairs repulsion; bounds the temporaries at LAYOUT_BLOCK_ROWS x N x 2
+LAYOUT_SEED = 42
+LAYOUT_FR_ITERATIONS = 50 # Force iterations for 'numba_fr'
+LAYOUT_FR_COOLING = 0.95 # Per-iteration temperature factor for 'numba_fr'
+LAYOUT_FA2_ITERATIONS = 50 # Iterations for 'forceatlas2'
+LAYOUT_FA2_THETA = 1.2 # Barnes-Hut opening angle: larger is faster and coarser (O(N log N) repulsion instead of O(N^2))
+
+# --- Tabular input helper ---
+def read_csv_typed(csv_path, dtype):
+    # Only the columns named in dtype are parsed, straight into their final types (no inference pass, no object ids)
+    return pd.read_csv(csv_path, usecols=list(dtype), dtype=dtype, engine='pyarrow' if PYARROW_AVAILABLE else 'c')
 
 # --- Load Data ---
 print("SCRIPT 8: Plotting 2-Section Graph...")
 try:
-    with open(HYPERGRAPH_STRUCTURE_FILE, 'r') as f:
-        data = json.load(f)
+    if ORJSON_AVAILABLE:
+        with open(HYPERGRAPH_STRUCTURE_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+    else:
+        with open(HYPERGRAPH_STRUCTURE_FILE, 'r') as f:
+            data = json.load(f)
     hyperedges = data.get('hyperedges', [])
     nodes = data.get('nodes', []) # List of all node IDs
 
-    individuals_df = pd.read_csv(INDIVIDUALS_FILE)
-    cluster_assignments_df = pd.read_csv(CLUSTER_ASSIGNMENTS_FILE)
+    individuals_df = read_csv_typed(INDIVIDUALS_FILE, {'individual_id': 'int32', 'true_group': 'category'})
+    cluster_assignments_df = read_csv_typed(CLUSTER_ASSIGNMENTS_FILE, {'individual_id': 'int32', 'cluster_id': 'int32'})
     print("Data loaded successfully.")
 
 except FileNotFoundError as e:
@@ -38,96 +123,358 @@ if not hyperedges:
     print("No hyperedges found in structure file. Cannot build 2-section graph.")
     exit()
 
-# --- Create the 2-Section Graph using NetworkX ---
-G_2section = nx.Graph()
-G_2section.add_nodes_from(nodes) # Add all nodes from the hypergraph
+# --- Pair emission kernel ---
+def emit_pairs(member_idx, member_offsets, pair_rows, pair_cols):
+    # Writes every within-hyperedge pair (i < j in member order) of the ragged member array into the preallocated
+    # pair buffers, hyperedge after hyperedge; returns the number of pairs written. Compiled with numba when
+    # PAIR_BACKEND == 'numba', so no per-hyperedge index arrays are allocated.
+    pos = 0
+    for e in range(len(member_offsets) - 1):
+        start, end = member_offsets[e], member_offsets[e + 1]
+        for i in range(start, end):
+            for j in range(i + 1, end):
+                pair_rows[pos] = member_idx[i]
+                pair_cols[pos] = member_idx[j]
+                pos += 1
+    return pos
+
+if NUMBA_AVAILABLE:
+    emit_pairs = njit(cache=True)(emit_pairs)
 
-# Add edges: two nodes are connected if they appear in the same hyperedge
-for he in hyperedges:
-    he_nodes = list(map(int, he)) # Ensure integer IDs
-    for i in range(len(he_nodes)):
-        for j in range(i + 1, len(he_nodes)):
-            G_2section.add_edge(he_nodes[i], he_nodes[j])
+# --- Create the 2-Section (or Incidence) Graph as a sparse adjacency matrix ---
+# Hyperedges parsed once into a ragged int32 array: members of hyperedge e are all_members[member_offsets[e]:member_offsets[e + 1]]
+member_counts = np.fromiter(map(len, hyperedges), dtype=np.int64, count=len(hyperedges))
+member_offsets = np.concatenate(([0], np.cumsum(member_counts)))
+all_members = np.fromiter((int(node) for he in hyperedges for node in he), dtype=np.int32, count=member_offsets[-1]) # Ensure integer IDs
 
-print(f"2-Section graph created with {G_2section.number_of_nodes()} nodes and {G_2section.number_of_edges()} edges.")
+# Row/column order follows the hypergraph node list; members missing from it are appended after
+node_ids = np.asarray(list(map(int, nodes)), dtype=np.int64)
+node_ids = np.concatenate([node_ids, np.setdiff1d(all_members.astype(np.int64), node_ids)])
+node_index = pd.Index(node_ids)
+member_idx = node_index.get_indexer(all_members).astype(np.int32) # Compact index of every member, hyperedge after hyperedge
+
+if GRAPH_VIEW == 'incidence':
+    # Bipartite incidence graph: individuals are nodes 0..N-1, hyperedge e is node N + e, and each membership is one
+    # star edge, so there are sum(k) edges instead of the sum(k^2) / 2 pairs of the 2-section
+    n_hyperedges = len(hyperedges)
+    edge_rows = member_idx.astype(np.int64)
+    edge_cols = len(node_ids) + np.repeat(np.arange(n_hyperedges), member_counts)
+    n_graph_nodes = len(node_ids) + n_hyperedges
+    plot_adjacency = sp.coo_matrix((np.ones(len(edge_rows)), (edge_rows, edge_cols)), shape=(n_graph_nodes, n_graph_nodes))
+    plot_adjacency = (plot_adjacency + plot_adjacency.T).tocsr()
+    plot_adjacency.data[:] = 1.0 # A member listed twice in one hyperedge still gives a single edge
+else:
+    if GRAPH_VIEW != '2section':
+        print(f"Warning: Unknown GRAPH_VIEW '{GRAPH_VIEW}'. Building the 2-section graph instead.")
+    # Two nodes are connected if they appear in the same hyperedge. The pair count of each hyperedge is known up front,
+    # so its triu_indices block is written straight into one preallocated pair of buffers (no per-hyperedge arrays to concatenate)
+    pair_offsets = np.concatenate(([0], np.cumsum(member_counts * (member_counts - 1) // 2)))
+    pair_rows = np.empty(pair_offsets[-1], dtype=np.int32)
+    pair_cols = np.empty(pair_offsets[-1], dtype=np.int32)
+    if PAIR_BACKEND == 'numba' and NUMBA_AVAILABLE:
+        emit_pairs(member_idx, member_offsets, pair_rows, pair_cols)
+    else:
+        if PAIR_BACKEND == 'numba':
+            print("Warning: numba is not installed. Falling back to the NumPy pair emission.")
+        for e in range(len(hyperedges)):
+            he_idx = member_idx[member_offsets[e]:member_offsets[e + 1]]
+            idx_i, idx_j = np.triu_indices(len(he_idx), k=1)
+            pair_rows[pair_offsets[e]:pair_offsets[e + 1]] = he_idx[idx_i]
+            pair_cols[pair_offsets[e]:pair_offsets[e + 1]] = he_idx[idx_j]
+    pair_rows = pair_rows.astype(np.uint64)
+    pair_cols = pair_cols.astype(np.uint64)
+    # Deduplicate pairs as single uint64 keys (smaller index in the high 32 bits) with a hash-based pd.unique
+    pair_keys = pd.unique((np.minimum(pair_rows, pair_cols) << np.uint64(32)) | np.maximum(pair_rows, pair_cols))
+    edge_rows = (pair_keys >> np.uint64(32)).astype(np.int64)
+    edge_cols = (pair_keys & np.uint64(0xFFFFFFFF)).astype(np.int64)
+    plot_adjacency = sp.coo_matrix((np.ones(len(pair_keys)), (edge_rows, edge_cols)), shape=(len(node_ids), len(node_ids)))
+    plot_adjacency = (plot_adjacency + plot_adjacency.T).tocsr() # Symmetrize; each pair is stored once per direction
+
+# NetworkX graph for layout and drawing. Nodes keep the contiguous labels of the adjacency rows, so positions,
+# colors and edge endpoints are plain array indices; node_ids[i] is the individual ID of node i (i < N).
+G_plot = nx.from_scipy_sparse_array(plot_adjacency)
+
+if GRAPH_VIEW == 'incidence':
+    print(f"Incidence graph created with {len(node_ids)} individual nodes, {n_hyperedges} hyperedge nodes and {G_plot.number_of_edges()} edges.")
+else:
+    print(f"2-Section graph created with {G_plot.number_of_nodes()} nodes and {G_plot.number_of_edges()} edges.")
 
 # --- Merge node attributes for coloring ---
-node_attributes = pd.merge(individuals_df[['individual_id', 'true_group']],
-                           cluster_assignments_df[['individual_id', 'cluster_id']],
-                           on='individual_id', how='left')
+# Index-aligned join on individual_id, then one reindex into individual node order (absent nodes get NaN attributes)
+node_attributes = individuals_df.set_index('individual_id')[['true_group']].join(
+    cluster_assignments_df.set_index('individual_id')[['cluster_id']], how='left')
+graph_node_attributes = node_attributes.reindex(node_ids)
+
+# Prepare color lookup tables: row i of a LUT is the RGBA color of level i (sorted), plus a final grey row
+# for nodes without a row in node_attributes or without a value. The level -> color dicts only feed the legends.
+def category_lut(levels, cmap_name):
+    palette = matplotlib.colormaps[cmap_name].resampled(len(levels))
+    return np.vstack([palette(np.arange(len(levels))), mcolors.to_rgba('grey')])
 
-# Prepare color maps
 true_group_to_color = {}
 if 'true_group' in node_attributes.columns:
     unique_true_groups = sorted(node_attributes['true_group'].dropna().unique())
     if unique_true_groups:
-        palette_true = cm.get_cmap('Paired', len(unique_true_groups)) if len(unique_true_groups) <=10 else cm.get_cmap('tab20', len(unique_true_groups))
-        true_group_to_color = {group: palette_true(i) for i, group in enumerate(unique_true_groups)}
+        lut_true = category_lut(unique_true_groups, 'Paired' if len(unique_true_groups) <= 10 else 'tab20')
+        true_group_to_color = dict(zip(unique_true_groups, map(tuple, lut_true)))
 
 cluster_id_to_color = {}
 if 'cluster_id' in node_attributes.columns:
     unique_clusters = sorted(node_attributes['cluster_id'].dropna().unique())
     if unique_clusters:
-        palette_cluster = cm.get_cmap('Set1', len(unique_clusters)) if len(unique_clusters) <=9 else cm.get_cmap('tab20', len(unique_clusters))
-        cluster_id_to_color = {cid: palette_cluster(i) for i, cid in enumerate(unique_clusters)}
+        lut_cluster = category_lut(unique_clusters, 'Set1' if len(unique_clusters) <= 9 else 'tab20')
+        cluster_id_to_color = dict(zip(unique_clusters, map(tuple, lut_cluster)))
+
+# Per-node RGBA arrays in individual node order, one LUT gather per attribute, shared by the plots
+# (code -1, from a missing value or a node absent from node_attributes, picks the grey last row)
+def node_color_array(attribute, levels, lut):
+    return lut[pd.Categorical(graph_node_attributes[attribute], categories=levels).codes]
+
+true_group_node_colors = node_color_array('true_group', unique_true_groups, lut_true) if true_group_to_color else None
+cluster_id_node_colors = node_color_array('cluster_id', unique_clusters, lut_cluster) if cluster_id_to_color else None
+
+# --- Fruchterman-Reingold layout by L-BFGS ---
+def fr_energy_and_grad(x, edge_src, edge_dst, k, gravity, block_rows):
+    # FR energy on flattened positions: attraction d^3/(3k) per edge (force d^2/k), repulsion -k^2 ln d per node pair
+    # (force k^2/d), plus gravity * |x|^2 / 2. Returns (energy, gradient) for minimize(jac=True).
+    pos = x.reshape(-1, 2)
+    n = len(pos)
+    grad = gravity * pos
+    energy = 0.5 * gravity * np.sum(pos ** 2)
+
+    delta = pos[edge_src] - pos[edge_dst]
+    dist = np.sqrt(np.sum(delta ** 2, axis=1)) + 1e-12
+    energy += np.sum(dist ** 3) / (3.0 * k)
+    pull = delta * (dist / k)[:, None]
+    for axis in range(2):
+        grad[:, axis] += np.bincount(edge_src, pull[:, axis], minlength=n) - np.bincount(edge_dst, pull[:, axis], minlength=n)
+
+    for start in range(0, n, block_rows):
+        block = pos[start:start + block_rows]
+        block_delta = block[:, None, :] - pos[None, :, :]
+        sq_dist = np.sum(block_delta ** 2, axis=2)
+        sq_dist[np.arange(len(block)), np.arange(start, start + len(block))] = 1.0 # Self pairs: zero force, constant energy
+        sq_dist = np.maximum(sq_dist, 1e-12)
+        energy -= 0.25 * k ** 2 * np.sum(np.log(sq_dist)) # Each unordered pair is seen from both rows
+        grad[start:start + block_rows] -= k ** 2 * np.sum(block_delta / sq_dist[:, :, None], axis=1)
+    return energy, grad.ravel()
+
+def lbfgs_fr_layout(adjacency, k, max_iter, gravity, block_rows, seed):
+    # Positions (rows in adjacency order) rescaled to [-1, 1] like nx.spring_layout
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.empty((0, 2))
+    upper = sp.triu(adjacency, k=1).tocoo() # Each undirected edge once
+    x0 = np.random.default_rng(seed).standard_normal((n, 2)).ravel()
+    res = minimize(fr_energy_and_grad, x0, args=(upper.row, upper.col, k, gravity, block_rows),
+                   jac=True, method='L-BFGS-B', options={'maxiter': max_iter})
+    return nx.rescale_layout(res.x.reshape(n, 2))
+
+# --- Fruchterman-Reingold layout by explicit force iterations ---
+def fr_step(pos, indptr, indices, k, t, disp):
+    # One FR iteration in place: repulsion k^2/d from every node, attraction d^2/k from CSR neighbours,
+    # then each move is capped at temperature t. Compiled with numba for LAYOUT_METHOD == 'numba_fr';
+    # node i only writes disp[i], and positions are updated after all forces are known.
+    n = pos.shape[0]
+    for i in prange(n):
+        dx = 0.0
+        dy = 0.0
+        for j in range(n):
+            if j != i:
+                ddx = pos[i, 0] - pos[j, 0]
+                ddy = pos[i, 1] - pos[j, 1]
+                sq = max(ddx * ddx + ddy * ddy, 1e-12)
+                dx += ddx * k * k / sq
+                dy += ddy * k * k / sq
+        for p in range(indptr[i], indptr[i + 1]):
+            j = indices[p]
+            ddx = pos[i, 0] - pos[j, 0]
+            ddy = pos[i, 1] - pos[j, 1]
+            d = np.sqrt(ddx * ddx + ddy * ddy)
+            dx -= ddx * d / k
+            dy -= ddy * d / k
+        disp[i, 0] = dx
+        disp[i, 1] = dy
+    for i in prange(n):
+        length = max(np.sqrt(disp[i, 0] * disp[i, 0] + disp[i, 1] * disp[i, 1]), 1e-12)
+        step = min(length, t) / length
+        pos[i, 0] += disp[i, 0] * step
+        pos[i, 1] += disp[i, 1] * step
+
+if NUMBA_AVAILABLE:
+    fr_step = njit(parallel=True, fastmath=True)(fr_step)
+
+def numba_fr_layout(adjacency, k, iterations, cooling, seed):
+    # Positions (rows in adjacency order) rescaled to [-1, 1]; starts from uniform [0, 1) like nx.spring_layout
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.empty((0, 2))
+    pos = np.random.default_rng(seed).random((n, 2))
+    disp = np.empty_like(pos)
+    indptr, indices = adjacency.indptr.astype(np.int64), adjacency.indices.astype(np.int64)
+    t = 0.1 # Initial temperature: a tenth of the starting [0, 1) frame
+    for _ in range(iterations):
+        fr_step(pos, indptr, indices, k, t, disp)
+        t *= cooling
+    return nx.rescale_layout(pos)
+
+def forceatlas2_layout(adjacency, iterations, theta, seed):
+    # Barnes-Hut ForceAtlas2 on the sparse adjacency; rows in adjacency order, rescaled to [-1, 1]
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.empty((0, 2))
+    fa2 = ForceAtlas2(barnesHutOptimize=True, barnesHutTheta=theta, scalingRatio=2.0, verbose=False)
+    start_pos = np.random.default_rng(seed).random((n, 2)) # fa2 would otherwise draw from the unseeded random module
+    return nx.rescale_layout(np.asarray(fa2.forceatlas2(adjacency, pos=start_pos, iterations=iterations), dtype=float))
+
+# --- Rasterized drawing with datashader ---
+def rasterize_2section(graph, pos, node_colors, n_marker_nodes=None):
+    # Edges aggregated as a log-shaded line count, nodes as one category per color; returns (PIL image, extent).
+    # Only the first n_marker_nodes nodes (all when None) get a marker.
+    coords = np.asarray(pos, dtype=float)
+    pad = 0.05 * max(np.ptp(coords, axis=0).max(), 1e-9)
+    x_range = (coords[:, 0].min() - pad, coords[:, 0].max() + pad)
+    y_range = (coords[:, 1].min() - pad, coords[:, 1].max() + pad)
+    canvas = ds.Canvas(plot_width=RASTER_WIDTH, plot_height=RASTER_HEIGHT, x_range=x_range, y_range=y_range)
+
+    nodes_df = pd.DataFrame({'x': coords[:, 0], 'y': coords[:, 1]}) # Row i is node i
+    edges_df = pd.DataFrame(list(graph.edges()), columns=['source', 'target'])
+    edge_img = tf.shade(canvas.line(connect_edges(nodes_df, edges_df), 'x', 'y', agg=ds.count()),
+                        cmap=['lightgray', 'black'], how='log')
+
+    marker_df = nodes_df.iloc[:n_marker_nodes].copy()
+    if isinstance(node_colors, str):
+        node_colors = [node_colors] * len(marker_df)
+    marker_df['color'] = pd.Categorical([mcolors.to_hex(c) for c in node_colors])
+    node_img = tf.shade(canvas.points(marker_df, 'x', 'y', agg=ds.count_cat('color')),
+                        color_key={c: c for c in marker_df['color'].cat.categories})
+    image = tf.stack(edge_img, tf.spread(node_img, px=RASTER_NODE_SPREAD)).to_pil()
+    return image, (x_range[0], x_range[1], y_range[0], y_range[1])
 
 # --- Plotting Function for 2-Section Graph ---
-def plot_2section_graph(graph, node_coloring_attribute, color_map, title, filename, pos=None):
-    plt.figure(figsize=(14, 11))
+def plot_2section_graph(graph, node_coloring_attribute, color_map, title, filename, pos=None, node_colors=None, n_marker_nodes=None):
+    # node_colors: (N, 4) RGBA array in graph.nodes() order, gathered from a color LUT by node_color_array().
+    # n_marker_nodes: draw markers for the first n nodes only (the individuals of an incidence graph); None draws all.
+    # Returns the saved file name.
+    fig = Figure(figsize=(14, 11))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
     
-    node_colors = []
-    if node_coloring_attribute in node_attributes.columns:
-        # Create a mapping from node ID to the attribute for coloring
-        attr_map = pd.Series(node_attributes[node_coloring_attribute].values, index=node_attributes.individual_id).to_dict()
-        # Get colors in the order of graph.nodes()
-        for node in graph.nodes():
-            attr_val = attr_map.get(node)
-            node_colors.append(color_map.get(attr_val, 'grey')) # Default to grey if not found
-    else:
+    if node_colors is None:
         node_colors = 'skyblue' # Default single color
 
     if pos is None:
         print(f"Calculating spring layout for: {title}...")
-        pos = nx.spring_layout(graph, k=0.2, iterations=50, seed=42) # k can be adjusted
+        spring_pos = nx.spring_layout(graph, k=0.2, iterations=50, seed=42) # k can be adjusted
+        pos = np.array([spring_pos[node] for node in range(graph.number_of_nodes())])
     
-    nx.draw_networkx_edges(graph, pos, alpha=0.2, width=0.5)
-    nx.draw_networkx_nodes(graph, pos, node_color=node_colors, node_size=100, edgecolors='black', linewidths=0.5)
-    # nx.draw_networkx_labels(graph, pos, font_size=6, alpha=0.8) # Labels can make it cluttered
+    if RENDER_BACKEND == 'datashader' and DATASHADER_AVAILABLE:
+        # Nodes and edges become one image; matplotlib only adds the title and legend around it
+        raster_image, raster_extent = rasterize_2section(graph, pos, node_colors, n_marker_nodes)
+        ax.imshow(raster_image, extent=raster_extent)
+    else:
+        if RENDER_BACKEND == 'datashader':
+            print("Warning: datashader is not installed. Drawing with NetworkX/matplotlib instead.")
+        # All edges as one (E, 2, 2) segment array in a single LineCollection, all nodes in one scatter call
+        pos_arr = np.asarray(pos, dtype=float)
+        edge_arr = np.array(list(graph.edges()), dtype=np.int64).reshape(-1, 2)
+        if len(edge_arr) > PLOT_MAX_EDGES: # Beyond this the alpha-blended edges are a uniform hairball; extra segments only add draw time
+            print(f"Drawing a random sample of {PLOT_MAX_EDGES} of the {len(edge_arr)} edges.")
+            edge_arr = edge_arr[np.random.default_rng(PLOT_EDGE_SAMPLE_SEED).choice(len(edge_arr), PLOT_MAX_EDGES, replace=False)]
+        ax.add_collection(LineCollection(pos_arr[edge_arr], colors='k', linewidths=0.5, alpha=0.2, zorder=1))
+        ax.scatter(pos_arr[:n_marker_nodes, 0], pos_arr[:n_marker_nodes, 1], c=node_colors, s=100, edgecolors='black', linewidths=0.5, zorder=2)
+        ax.autoscale_view()
+    # nx.draw_networkx_labels(graph, dict(enumerate(pos)), labels=dict(enumerate(node_ids.tolist())), font_size=6, alpha=0.8) # Labels can make it cluttered
 
-    plt.title(title, fontsize=16)
+    ax.set_title(title, fontsize=16)
     
     if color_map: # Create legend
-        legend_handles = [plt.Line2D([0], [0], marker='o', color='w', label=str(group),
-                                      markerfacecolor=color, markersize=10)
+        legend_handles = [Line2D([0], [0], marker='o', color='w', label=str(group),
+                                  markerfacecolor=color, markersize=10)
                           for group, color in color_map.items()]
-        plt.legend(handles=legend_handles, title=node_coloring_attribute.replace('_',' ').title(),
-                   bbox_to_anchor=(1.02, 1), loc='upper left', fontsize=10)
-        plt.subplots_adjust(right=0.85)
-        
-    plt.axis('off')
-    plt.savefig(filename, bbox_inches='tight')
-    print(f"Saved 2-section graph plot to {filename}")
-    # plt.show()
+        ax.legend(handles=legend_handles, title=node_coloring_attribute.replace('_',' ').title(),
+                  bbox_to_anchor=(1.02, 1), loc='upper left', fontsize=10)
+
+    ax.set_axis_off()
+    # Fixed margins (legend in the right 15%) instead of bbox_inches='tight', which re-draws the figure to measure it
+    fig.subplots_adjust(left=0.02, right=0.85, top=0.95, bottom=0.02)
+    fig.savefig(filename, dpi=PLOT_DPI)
+    return filename
 
 # --- Generate and Save Plots ---
 # Calculate a common position layout once if you want plots to be comparable
-print("Calculating initial layout for 2-section graph (may take a moment)...")
-common_pos = nx.spring_layout(G_2section, k=0.2, iterations=50, seed=42)
+# Layouts are cached on disk, keyed by the graph structure and every setting that affects the result
+layout_settings = (LAYOUT_METHOD, LAYOUT_K, LAYOUT_MAX_ITER, LAYOUT_GRAVITY, LAYOUT_SEED, LAYOUT_FR_ITERATIONS,
+                   LAYOUT_FR_COOLING, LAYOUT_FA2_ITERATIONS, LAYOUT_FA2_THETA, NUMBA_AVAILABLE, FA2_AVAILABLE)
+layout_hash = hashlib.sha1(node_ids.tobytes() + plot_adjacency.indptr.tobytes() + plot_adjacency.indices.tobytes()
+                           + repr(layout_settings).encode())
+layout_cache_file = LAYOUT_CACHE_FILE_TEMPLATE.format(key=layout_hash.hexdigest()[:16])
+numba_threads_started = False # Set once a numba parallel kernel has run; its thread pool is not fork-safe
+if os.path.exists(layout_cache_file):
+    common_pos = np.load(layout_cache_file)
+    print(f"Loaded cached graph layout from {layout_cache_file}")
+else:
+    print("Calculating initial graph layout (may take a moment)...")
+    if LAYOUT_METHOD not in ('lbfgs', 'numba_fr', 'forceatlas2', 'spring'):
+        print(f"Warning: Unknown LAYOUT_METHOD '{LAYOUT_METHOD}'. Falling back to the L-BFGS layout.")
+    if LAYOUT_METHOD == 'numba_fr' and not NUMBA_AVAILABLE:
+        print("Warning: numba is not installed. Falling back to the L-BFGS layout.")
+    if LAYOUT_METHOD == 'forceatlas2' and not FA2_AVAILABLE:
+        print("Warning: fa2_modified is not installed. Falling back to the L-BFGS layout.")
+    # Every branch gives an (N, 2) array; row i is the position of node i
+    if LAYOUT_METHOD == 'forceatlas2' and FA2_AVAILABLE:
+        common_pos = forceatlas2_layout(plot_adjacency, LAYOUT_FA2_ITERATIONS, LAYOUT_FA2_THETA, LAYOUT_SEED)
+    elif LAYOUT_METHOD == 'numba_fr' and NUMBA_AVAILABLE:
+        common_pos = numba_fr_layout(plot_adjacency, LAYOUT_K, LAYOUT_FR_ITERATIONS, LAYOUT_FR_COOLING, LAYOUT_SEED)
+        numba_threads_started = True
+    elif LAYOUT_METHOD == 'spring':
+        spring_pos = nx.spring_layout(G_plot, k=LAYOUT_K, iterations=50, seed=LAYOUT_SEED)
+        common_pos = np.array([spring_pos[node] for node in range(G_plot.number_of_nodes())])
+    else:
+        common_pos = lbfgs_fr_layout(plot_adjacency, LAYOUT_K, LAYOUT_MAX_ITER, LAYOUT_GRAVITY, LAYOUT_BLOCK_ROWS, LAYOUT_SEED)
+    np.save(layout_cache_file, common_pos)
+    # Only the layout for the current graph and settings is kept; older entries are removed on write
+    for stale_cache_file in glob.glob(LAYOUT_CACHE_FILE_TEMPLATE.format(key='*')):
+        if stale_cache_file != layout_cache_file:
+            os.remove(stale_cache_file)
 
-# Plot 1: 2-Section graph colored by True Group
+# Plot 1: colored by True Group; Plot 2: colored by Found Hypergraph Cluster ID
+# Incidence graphs get their own output files, and their hyperedge nodes (indices >= N) are left without markers
+if GRAPH_VIEW == 'incidence':
+    graph_label, plot_files = "Incidence Graph", (INCIDENCE_PLOT_TRUE_GROUPS_FILE, INCIDENCE_PLOT_FOUND_CLUSTERS_FILE)
+else:
+    graph_label, plot_files = "2-Section Graph", (TWASECTION_PLOT_TRUE_GROUPS_FILE, TWASECTION_PLOT_FOUND_CLUSTERS_FILE)
+plot_jobs = []
 if true_group_to_color:
-    plot_2section_graph(G_2section, 'true_group', true_group_to_color,
-                        "2-Section Graph (Nodes colored by True Group)",
-                        TWASECTION_PLOT_TRUE_GROUPS_FILE, pos=common_pos)
+    plot_jobs.append((G_plot, 'true_group', true_group_to_color,
+                      f"{graph_label} (Nodes colored by True Group)",
+                      plot_files[0], common_pos, true_group_node_colors, len(node_ids)))
 else:
     print("Skipping plot by true_group due to missing color map.")
-
-# Plot 2: 2-Section graph colored by Found Hypergraph Cluster ID
 if cluster_id_to_color:
-    plot_2section_graph(G_2section, 'cluster_id', cluster_id_to_color,
-                        "2-Section Graph (Nodes colored by Hypergraph Cluster ID)",
-                        TWASECTION_PLOT_FOUND_CLUSTERS_FILE, pos=common_pos)
+    plot_jobs.append((G_plot, 'cluster_id', cluster_id_to_color,
+                      f"{graph_label} (Nodes colored by Hypergraph Cluster ID)",
+                      plot_files[1], common_pos, cluster_id_node_colors, len(node_ids)))
 else:
     print("Skipping plot by cluster_id due to missing color map.")
 
+def run_plot_job(job_index):
+    # Looks the job up in plot_jobs, which forked workers inherit, so the graph and layout are never pickled;
+    # returns the saved file name so the parent reports it (worker prints would interleave)
+    return plot_2section_graph(*plot_jobs[job_index])
+
+# The plots are independent renders of the same layout; forked worker processes draw them side by side.
+# They are drawn one after the other without the 'fork' start method (e.g. on Windows), with PLOT_N_WORKERS = 1,
+# or after the numba_fr layout ran in this process (forking after numba's parallel thread pool started can deadlock).
+if numba_threads_started and PLOT_N_WORKERS > 1 and len(plot_jobs) > 1:
+    print("Note: the layout ran numba's parallel thread pool in this process, so the plots are drawn one at a time.")
+if (PLOT_N_WORKERS > 1 and len(plot_jobs) > 1 and not numba_threads_started
+        and 'fork' in multiprocessing.get_all_start_methods()):
+    with multiprocessing.get_context('fork').Pool(min(PLOT_N_WORKERS, len(plot_jobs))) as pool:
+        saved_files = pool.map(run_plot_job, range(len(plot_jobs)))
+else:
+    saved_files = [run_plot_job(job_index) for job_index in range(len(plot_jobs))]
+for saved_file in saved_files:
+    print(f"Saved graph plot to {saved_file}")
+
 print("\nSCRIPT 8: 2-Section graph plotting attempt complete.")
\ No newline at end of file
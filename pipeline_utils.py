@@ -0,0 +1,29 @@
+# Helpers shared by the pipeline scripts; keep this file next to them so `from pipeline_utils import ...` resolves
+
+import os
+import pandas as pd
+# pyarrow is optional: when present, CSV inputs are cached as Parquet next to the originals
+try:
+    import pyarrow # noqa: F401 (Parquet engine used by pandas)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# --- Tabular input helper (Scripts 2, 6 and 7) ---
+def load_table(csv_path):
+    # Parquet copy of csv_path is used while it is at least as new as the CSV; otherwise the CSV is parsed and the copy refreshed
+    parquet_path = csv_path.replace('.csv', '.parquet')
+    if PARQUET_AVAILABLE and os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        return pd.read_parquet(parquet_path)
+    df = pd.read_csv(csv_path)
+    if PARQUET_AVAILABLE:
+        df.to_parquet(parquet_path, index=False)
+    return df
+
+# --- Trait scaling helper (Scripts 2 and 6) ---
+def zscore_columns(X):
+    # Column-wise standardization (population std, as StandardScaler); constant columns are only centered
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    return (X - mean) / std